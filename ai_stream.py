@@ -0,0 +1,143 @@
+import os
+import json
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Streaming configuration
+# -----------------------------------
+AI_STREAMING = os.environ.get("AI_STREAMING", "1") == "1"
+
+STREAM_DONE = object()
+
+
+def parse_sse_line(line):
+    """
+    Return the content delta carried by one server-sent event line,
+    STREAM_DONE at the end of the stream, or None for anything else
+    """
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return STREAM_DONE
+    try:
+        event = json.loads(data)
+        return event["choices"][0].get("delta", {}).get("content") or None
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+# -----------------------------------
+# Incremental JSON answer detection
+# -----------------------------------
+class JSONAnswerScanner:
+    """
+    Scan streamed text for the first complete top-level JSON object that
+    contains required_key, without re-parsing the text on every chunk.
+    With required_key=None it only collects the text.
+    """
+
+    def __init__(self, required_key="answer"):
+        self.required_key = required_key
+        self.text = ""
+        self.result = None
+        self.span = None
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """Add a chunk; returns True once a complete answer object is seen"""
+        self.text += chunk
+        if self.required_key is None:
+            return False
+        text = self.text
+        while self._pos < len(text):
+            c = text[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if c == "{":
+                    self._start = self._pos - 1
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._try_candidate(text[self._start:self._pos]):
+                        return True
+                    self._start = None
+        return False
+
+    def _try_candidate(self, candidate):
+        try:
+            obj = json.loads(candidate)
+        except ValueError:
+            return False
+        if isinstance(obj, dict) and self.required_key in obj:
+            self.result = obj
+            self.span = (self._start, self._pos)
+            return True
+        return False
+
+    def reply_text(self):
+        """Just the answer object's text once found, else everything seen"""
+        return self.text[self.span[0]:self.span[1]] if self.span else self.text
+
+
+# -----------------------------------
+# Per-call stream timings
+# -----------------------------------
+class StreamTimings:
+    """Keep time-to-first-token and time-to-answer for recent AI calls"""
+
+    def __init__(self, max_samples=500):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, ttft, tta, total, early_stop):
+        sample = {
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "tta_ms": round(tta * 1000, 1) if tta is not None else None,
+            "total_ms": round(total * 1000, 1),
+            "early_stop": early_stop,
+        }
+        with self._lock:
+            self._samples.append(sample)
+        logger.info(f"AI stream timings: {sample}")
+
+    def summary(self):
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {"count": 0}
+
+        def percentile(key, p):
+            values = sorted(s[key] for s in samples if s[key] is not None)
+            return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+        return {
+            "count": len(samples),
+            "early_stops": sum(1 for s in samples if s["early_stop"]),
+            "ttft_p50_ms": percentile("ttft_ms", 0.5),
+            "tta_p50_ms": percentile("tta_ms", 0.5),
+            "tta_p95_ms": percentile("tta_ms", 0.95),
+        }
+
+
+AI_STREAM_TIMINGS = StreamTimings()
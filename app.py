@@ -1,10 +1,21 @@
 import os
-import json
 import time
-import requests
-from flask import Flask, request, jsonify
-from quiz_solver import solve_quiz_with_ai
-from playwright.sync_api import sync_playwright
+from flask import Flask, Response, request, jsonify
+from quiz_pipeline import check_credentials, validate_quiz_request, run_quiz
+from browser_pool import BROWSER_POOL
+from page_readiness import READINESS_RECORDER
+from request_blocking import BLOCKING_PROFILE
+from static_fetch import FETCH_TIER_STATS
+from jobs import JobStore, JobQueue, QueueFull
+from download_cache import DOWNLOAD_CACHE
+from llm_cache import LLM_CACHE
+from ai_stream import AI_STREAM_TIMINGS
+from http_client import HTTP_METRICS
+from sandbox import SANDBOX_POOL
+from retry_policy import retry_summary
+from tracing import METRICS, PROMETHEUS_CONTENT_TYPE
+from strategy_race import RACE_STATS
+from model_router import ROUTER_STATS
 import logging
 
 # Set up logging
@@ -13,144 +24,8 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# -----------------------------------
-# Load environment variables
-# -----------------------------------
-STUDENT_EMAIL = os.environ.get("STUDENT_EMAIL")
-STUDENT_SECRET = os.environ.get("STUDENT_SECRET")
-
 # Validate required environment variables
-if not STUDENT_EMAIL or not STUDENT_SECRET:
-    logger.error("Missing required environment variables: STUDENT_EMAIL and STUDENT_SECRET must be set")
-
-# -----------------------------------
-# Fetch and render quiz page with JavaScript
-# -----------------------------------
-def fetch_quiz_page(url):
-    """
-    Use Playwright to render JavaScript-heavy quiz pages
-    """
-    try:
-        with sync_playwright() as p:
-            # Launch browser in headless mode for Docker
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            
-            # Set longer timeout for slow pages
-            page.set_default_timeout(30000)
-            
-            # Navigate to the quiz URL (the one provided in the POST request)
-            logger.info(f"Fetching quiz page: {url}")
-            page.goto(url, wait_until="networkidle")
-            
-            # Wait for content to load
-            page.wait_for_timeout(3000)
-            
-            # Get the fully rendered HTML
-            content = page.content()
-            
-            browser.close()
-            logger.info(f"Successfully fetched quiz page: {url}")
-            return content
-    except Exception as e:
-        logger.error(f"Error fetching quiz page {url}: {e}")
-        return None
-
-# -----------------------------------
-# Extract quiz instructions and submit URL
-# -----------------------------------
-def parse_quiz_content(html_content):
-    """
-    Parse the rendered HTML to extract quiz instructions and submit URL
-    """
-    try:
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Extract text content - this will contain the quiz instructions
-        text_content = soup.get_text(separator='\n', strip=True)
-        
-        # Look for submit URL in the content
-        import re
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-        urls = re.findall(url_pattern, text_content)
-        
-        # Find submit URL - look for patterns in the instructions
-        submit_url = None
-        
-        # Method 1: Look for "Post your answer to" or similar patterns
-        if "post your answer to" in text_content.lower():
-            lines = text_content.split('\n')
-            for i, line in enumerate(lines):
-                if "post your answer to" in line.lower() and i + 1 < len(lines):
-                    submit_url = lines[i + 1].strip()
-                    break
-        
-        # Method 2: Look for JSON payload that contains submit URL
-        if not submit_url:
-            json_pattern = r'\{[^}]+\}'
-            json_matches = re.findall(json_pattern, text_content)
-            for json_str in json_matches:
-                try:
-                    data = json.loads(json_str)
-                    if isinstance(data, dict) and 'url' in data:
-                        submit_url = data['url']
-                        break
-                except:
-                    continue
-        
-        # Method 3: Look for URLs containing 'submit'
-        if not submit_url:
-            for url in urls:
-                if 'submit' in url.lower():
-                    submit_url = url
-                    break
-        
-        logger.info(f"Extracted submit URL: {submit_url}")
-        
-        return {
-            "instructions": text_content,
-            "submit_url": submit_url,
-            "html_content": html_content
-        }
-    except Exception as e:
-        logger.error(f"Error parsing quiz content: {e}")
-        return None
-
-# -----------------------------------
-# Submit answer to the target URL
-# -----------------------------------
-def submit_answer(submit_url, answer_data):
-    """
-    Submit the final answer to the specified endpoint
-    """
-    try:
-        logger.info(f"Submitting answer to: {submit_url}")
-        logger.info(f"Submission data: {answer_data}")
-        
-        response = requests.post(
-            submit_url,
-            json=answer_data,
-            timeout=30
-        )
-        logger.info(f"Submission response status: {response.status_code}")
-        
-        # Try to parse JSON response
-        try:
-            result = response.json()
-            logger.info(f"Submission response: {result}")
-            return result
-        except json.JSONDecodeError:
-            # If not JSON, return text response
-            logger.warning(f"Non-JSON response: {response.text[:200]}")
-            return {
-                "status": response.status_code,
-                "text": response.text[:500] if response.text else "Empty response"
-            }
-            
-    except Exception as e:
-        logger.error(f"Error submitting answer to {submit_url}: {e}")
-        return {"error": str(e)}
+check_credentials()
 
 # -----------------------------------
 # Main Quiz Endpoint
@@ -165,84 +40,54 @@ def quiz():
     
     body = request.get_json()
     
-    # Validate required fields
-    required_fields = ["email", "secret", "url"]
-    for field in required_fields:
-        if field not in body:
-            return jsonify({"error": f"Missing field: {field}"}), 400
-    
-    # Authenticate
-    if body["email"] != STUDENT_EMAIL or body["secret"] != STUDENT_SECRET:
-        return jsonify({"error": "Invalid email or secret"}), 403
-    
-    quiz_url = body["url"]
-    logger.info(f"Processing quiz URL: {quiz_url}")
+    error = validate_quiz_request(body)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
     
+    # Hand the quiz to a background worker and acknowledge right away
     try:
-        # Step 1: Fetch and render the quiz page
-        html_content = fetch_quiz_page(quiz_url)
-        if not html_content:
-            return jsonify({"error": "Failed to fetch quiz page"}), 500
-        
-        # Step 2: Parse quiz content
-        quiz_data = parse_quiz_content(html_content)
-        if not quiz_data:
-            return jsonify({"error": "Failed to parse quiz content"}), 500
-        
-        logger.info(f"Parsed instructions preview: {quiz_data['instructions'][:500]}...")
-        logger.info(f"Submit URL found: {quiz_data['submit_url']}")
-        
-        # Step 3: Use AI to solve the quiz
-        ai_solution = solve_quiz_with_ai(quiz_data)
-        if not ai_solution:
-            return jsonify({"error": "AI failed to solve quiz"}), 500
-        
-        logger.info(f"AI solution: {ai_solution}")
-        
-        # Step 4: Prepare answer payload
-        answer_payload = {
-            "email": STUDENT_EMAIL,
-            "secret": STUDENT_SECRET,
-            "url": quiz_url,
-            "answer": ai_solution.get("answer")
-        }
-        
-        # Add any additional fields from AI solution
-        if "additional_fields" in ai_solution:
-            answer_payload.update(ai_solution["additional_fields"])
-        
-        # Step 5: Submit answer
-        submit_url = ai_solution.get("submit_url") or quiz_data.get("submit_url")
-        if not submit_url:
-            return jsonify({"error": "No submit URL found"}), 500
-        
-        submission_result = submit_answer(submit_url, answer_payload)
-        
-        # Check if we're within time limit
-        elapsed_time = time.time() - start_time
-        if elapsed_time > 170:  # 170 seconds for safety margin
-            return jsonify({"error": "Approaching timeout limit", "elapsed_time": elapsed_time}), 500
-        
-        return jsonify({
-            "status": "completed",
-            "submission_result": submission_result,
-            "time_elapsed": round(elapsed_time, 2),
-            "quiz_instructions_preview": quiz_data["instructions"][:200] + "..." if len(quiz_data["instructions"]) > 200 else quiz_data["instructions"],
-            "submit_url_used": submit_url,
-            "answer_submitted": ai_solution.get("answer")
-        })
-        
-    except Exception as e:
-        logger.error(f"Unexpected error in quiz endpoint: {e}")
-        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+        job_id = JOB_QUEUE.submit(body["url"], start_time)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 200
+
+JOB_QUEUE = JobQueue(JobStore(), run_quiz)
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = JOB_QUEUE.store.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
 
 @app.route("/")
 def home():
     return "Quiz solver is running."
 
+@app.route("/metrics")
+def metrics():
+    return Response(METRICS.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
 @app.route("/health")
 def health():
-    return jsonify({"status": "healthy", "service": "quiz_solver"})
+    return jsonify({
+        "status": "healthy",
+        "service": "quiz_solver",
+        "browser_pool": BROWSER_POOL.stats(),
+        "render_readiness": READINESS_RECORDER.summary(),
+        "request_blocking": BLOCKING_PROFILE.summary(),
+        "fetch_tiers": FETCH_TIER_STATS.summary(),
+        "jobs": JOB_QUEUE.stats(),
+        "http": HTTP_METRICS.summary(),
+        "download_cache": DOWNLOAD_CACHE.stats(),
+        "llm_cache": LLM_CACHE.stats(),
+        "ai_stream": AI_STREAM_TIMINGS.summary(),
+        "retries": retry_summary(),
+        "sandbox": SANDBOX_POOL.stats(),
+        "strategy_race": RACE_STATS.summary(),
+        "model_router": ROUTER_STATS.summary()
+    })
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+from quart import Quart, Response, request, jsonify
+from quiz_pipeline import check_credentials, validate_quiz_request
+from async_pipeline import run_quiz_async, ASYNC_BROWSER_POOL, STAGE_LIMITS
+from download_cache import DOWNLOAD_CACHE
+from llm_cache import LLM_CACHE
+from ai_stream import AI_STREAM_TIMINGS
+from http_client import close_async_client, HTTP_METRICS
+from sandbox import SANDBOX_POOL
+from retry_policy import retry_summary
+from tracing import METRICS, PROMETHEUS_CONTENT_TYPE
+from strategy_race import RACE_STATS
+from model_router import ROUTER_STATS
+from jobs import JobStore, AsyncJobQueue, QueueFull
+from page_readiness import READINESS_RECORDER
+from request_blocking import BLOCKING_PROFILE
+from static_fetch import FETCH_TIER_STATS
+
+logger = logging.getLogger(__name__)
+
+# ASGI app serving the same routes as app.py, run many quizzes per process
+app = Quart(__name__)
+
+# Validate required environment variables
+check_credentials()
+
+JOB_QUEUE = AsyncJobQueue(JobStore(), run_quiz_async)
+
+@app.after_serving
+async def shutdown():
+    await JOB_QUEUE.shutdown()
+    await close_async_client()
+    await ASYNC_BROWSER_POOL.shutdown()
+
+# -----------------------------------
+# Main Quiz Endpoint (async)
+# -----------------------------------
+@app.route("/quiz", methods=["POST"])
+async def quiz():
+    start_time = time.time()
+
+    # Validate request
+    if not request.is_json:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    body = await request.get_json(silent=True)
+    if body is None:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    error = validate_quiz_request(body)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    # Hand the quiz to a background worker and acknowledge right away
+    try:
+        job_id = await JOB_QUEUE.submit(body["url"], start_time)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 200
+
+@app.route("/jobs/<job_id>")
+async def job_status(job_id):
+    job = await JOB_QUEUE.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
+
+@app.route("/")
+async def home():
+    return "Quiz solver is running."
+
+@app.route("/metrics")
+async def metrics():
+    return Response(METRICS.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+@app.route("/health")
+async def health():
+    return jsonify({
+        "status": "healthy",
+        "service": "quiz_solver",
+        "mode": "async",
+        "browser_pool": ASYNC_BROWSER_POOL.stats(),
+        "stage_limits": {stage: limit.stats() for stage, limit in STAGE_LIMITS.items()},
+        "render_readiness": READINESS_RECORDER.summary(),
+        "request_blocking": BLOCKING_PROFILE.summary(),
+        "fetch_tiers": FETCH_TIER_STATS.summary(),
+        "jobs": JOB_QUEUE.stats(),
+        "http": HTTP_METRICS.summary(),
+        "download_cache": DOWNLOAD_CACHE.stats(),
+        "llm_cache": LLM_CACHE.stats(),
+        "ai_stream": AI_STREAM_TIMINGS.summary(),
+        "retries": retry_summary(),
+        "sandbox": SANDBOX_POOL.stats(),
+        "strategy_race": RACE_STATS.summary(),
+        "model_router": ROUTER_STATS.summary()
+    })
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host="0.0.0.0", port=port, debug=False)
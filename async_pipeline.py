@@ -0,0 +1,626 @@
+import os
+import time
+import json
+import asyncio
+import logging
+import http_client
+from quiz_pipeline import (
+    parse_quiz_content, read_submission_response, build_answer_payload, timed_stage,
+    start_attempts, finish_attempt, finish_hop, record_hop, finish_chain
+)
+from browser_pool import BROWSER_MAX_USES
+from quiz_chain import ChainScheduler
+from page_readiness import goto_when_ready_async
+from request_blocking import BLOCKING_PROFILE
+from static_fetch import STATIC_FETCH_ENABLED, STATIC_FETCH_TIMEOUT, evaluate_static_html, FETCH_TIER_STATS
+from file_pipeline import find_file_urls, file_extension, parse_with_cache, FILE_MAX_COUNT, FILE_DEADLINE
+from download_cache import DOWNLOAD_CACHE
+from llm_cache import LLM_CACHE, LLM_CACHE_BYPASS_ON_RETRY
+from retry_policy import AI_RETRY, DOWNLOAD_RETRY, SUBMIT_RETRY
+from tracing import span, record_llm_usage
+from model_router import ROUTER_STATS, choose_route, escalate, escalation_reason, tag_route
+from compute_engine import LOCAL_COMPUTE_ENABLED, LOCAL_COMPUTE_TYPES, tabular_files, build_plan_prompt, parse_plan, solve_locally
+from code_exec import CODE_EXEC_TYPES, usable_files, stage_files, clear_stage, build_code_prompt, extract_code, run_generated_code
+from sandbox import SANDBOX_ENABLED
+from ai_stream import AI_STREAMING, AI_STREAM_TIMINGS, JSONAnswerScanner, parse_sse_line, STREAM_DONE
+from quiz_solver import CODE_EXEC_QUESTION_TYPES, AIPIPE_URL, build_ai_request, build_prompt, parse_ai_response, prepare_quiz, simple_solver
+from strategy_race import RACE_ENABLED, candidate_pool, take_fallback, plan_strategies, arace
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Async mode configuration
+# -----------------------------------
+ASYNC_BROWSER_CONTEXTS = int(os.environ.get("ASYNC_BROWSER_CONTEXTS", 4))
+
+
+class StageLimit:
+    """Semaphore for one stage that also counts work in flight and waiting"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+# Per-stage concurrency limits, shared by every quiz running in the process
+STAGE_LIMITS = {
+    "fetch": StageLimit(int(os.environ.get("ASYNC_FETCH_CONCURRENCY", 4))),
+    "ai": StageLimit(int(os.environ.get("ASYNC_AI_CONCURRENCY", 8))),
+    "download": StageLimit(int(os.environ.get("ASYNC_DOWNLOAD_CONCURRENCY", 16))),
+    "submit": StageLimit(int(os.environ.get("ASYNC_SUBMIT_CONCURRENCY", 8))),
+}
+
+# -----------------------------------
+# Async browser: one Chromium, many warm contexts
+# -----------------------------------
+class AsyncBrowserPool:
+    """
+    A single async Chromium with a queue of warm contexts.
+
+    Contexts are recycled after max_uses renders; the browser is relaunched
+    if it disconnects.
+    """
+
+    def __init__(self, size=ASYNC_BROWSER_CONTEXTS, max_uses=BROWSER_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self._playwright = None
+        self._browser = None
+        self._contexts = None
+        self._uses = {}
+        self._lock = None
+        self._in_use = 0
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recycles = 0
+
+    async def start(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._browser and self._browser.is_connected():
+                return
+            if self._playwright is None:
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self._contexts = asyncio.Queue()
+            self._uses = {}
+            for _ in range(self.size):
+                await self._contexts.put(await self._new_context())
+            logger.info(f"Started async browser with {self.size} contexts")
+
+    async def _new_context(self):
+        context = await self._browser.new_context()
+        self._uses[id(context)] = 0
+        return context
+
+    async def run(self, fn):
+        """
+        Check out a warm context, await fn(context) and return the result
+        """
+        await self.start()
+        contexts = self._contexts
+
+        wait_start = time.time()
+        context = await contexts.get()
+        wait_time = time.time() - wait_start
+        self._in_use += 1
+        self._checkouts += 1
+        self._total_wait += wait_time
+        self._max_wait = max(self._max_wait, wait_time)
+
+        try:
+            return await fn(context)
+        finally:
+            self._in_use -= 1
+            # Contexts from before a relaunch belong to a dead browser
+            if contexts is self._contexts:
+                released = await self._release(context)
+                if released is not None:
+                    await contexts.put(released)
+
+    async def _release(self, context):
+        """Reset or replace a context before it goes back into the queue"""
+        uses = self._uses.pop(id(context), 0) + 1
+        try:
+            if not self._browser.is_connected():
+                raise RuntimeError("browser disconnected")
+            if uses >= self.max_uses:
+                self._recycles += 1
+                await context.close()
+                return await self._new_context()
+            await context.clear_cookies()
+            self._uses[id(context)] = uses
+            return context
+        except Exception as e:
+            logger.error(f"Async browser crashed, relaunching: {e}")
+            self._recycles += 1
+            self._browser = None
+            await self.start()
+            return None
+
+    async def shutdown(self):
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "started": self._browser is not None,
+            "in_use": self._in_use,
+            "checkouts": self._checkouts,
+            "avg_wait_ms": round(self._total_wait / self._checkouts * 1000, 2) if self._checkouts else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+            "recycles": self._recycles,
+        }
+
+
+ASYNC_BROWSER_POOL = AsyncBrowserPool()
+
+
+# -----------------------------------
+# Async fetch
+# -----------------------------------
+async def fetch_static_async(url):
+    """
+    Async version of static_fetch.fetch_static
+    """
+    if not STATIC_FETCH_ENABLED:
+        return None
+
+    start = time.time()
+    html_content = None
+    tier = "static"
+    try:
+        response = await http_client.aget(url, timeout=STATIC_FETCH_TIMEOUT)
+        content_type = response.headers.get("content-type", "")
+        if response.status_code == 200 and "html" in content_type.lower():
+            html_content, tier = await asyncio.to_thread(evaluate_static_html, response.text)
+    except Exception as e:
+        logger.warning(f"Static fetch failed for {url}: {e}")
+
+    FETCH_TIER_STATS.record(tier, html_content is not None, time.time() - start)
+    return html_content
+
+async def render_page_async(context, url):
+    page = await context.new_page()
+    blocking_stats = await BLOCKING_PROFILE.install_async(page, url)
+    try:
+        page.set_default_timeout(30000)
+        await goto_when_ready_async(page, url)
+        return await page.content()
+    finally:
+        await page.close()
+        BLOCKING_PROFILE.record(blocking_stats)
+
+async def fetch_quiz_page_async(url):
+    """
+    Static GET first, async browser render only when needed
+    """
+    async with STAGE_LIMITS["fetch"]:
+        logger.info(f"Fetching quiz page: {url}")
+        with span("fetch.static"):
+            content = await fetch_static_async(url)
+        if content:
+            return content
+
+        start = time.time()
+        with span("fetch.browser") as current:
+            try:
+                content = await ASYNC_BROWSER_POOL.run(lambda context: render_page_async(context, url))
+                FETCH_TIER_STATS.record("browser", True, time.time() - start)
+                return content
+            except Exception as e:
+                current.fail(e)
+                FETCH_TIER_STATS.record("browser", False, time.time() - start)
+                logger.error(f"Error fetching quiz page {url}: {e}")
+                return None
+
+
+# -----------------------------------
+# Async AI, downloads and submission
+# -----------------------------------
+async def call_ai_async(prompt, max_retries=None, bypass_cache=False, deadline=None, answer_key="answer", route=None):
+    """
+    Async version of quiz_solver.call_ai
+    """
+    route = route or choose_route("default", prompt)
+    headers, payload = build_ai_request(prompt, route)
+    if bypass_cache:
+        LLM_CACHE.record_bypass()
+    else:
+        cached = await asyncio.to_thread(LLM_CACHE.get, payload)
+        if cached is not None:
+            ROUTER_STATS.record_cache_hit(route)
+            return cached
+
+    start = time.time()
+    content = None
+    usage = None
+
+    async def attempt(timeout):
+        nonlocal content, usage
+        if AI_STREAMING:
+            async with http_client.astream("POST", AIPIPE_URL, headers=headers, json=payload, timeout=timeout) as response:
+                if response.status_code == 200:
+                    content = await read_ai_stream_async(response, start, answer_key)
+                else:
+                    await response.aread()
+        else:
+            response = await http_client.apost(AIPIPE_URL, headers=headers, json=payload, timeout=timeout)
+            if response.status_code == 200:
+                body = response.json()
+                content = body["choices"][0]["message"]["content"]
+                usage = body.get("usage")
+        return response
+
+    with span("llm", streaming=AI_STREAMING, route=route["name"], model=route["model"]) as current:
+        async with STAGE_LIMITS["ai"]:
+            try:
+                response = await AI_RETRY.acall(AIPIPE_URL, attempt, deadline, max_attempts=max_retries)
+            except Exception as e:
+                current.fail(e)
+                logger.error(f"AIPIPE API error: {e}")
+                ROUTER_STATS.record_call(route, time.time() - start, prompt, None)
+                return None
+
+        if response.status_code != 200:
+            current.fail(f"HTTP {response.status_code}")
+            logger.error(f"AIPIPE API error: {response.status_code} - {response.text}")
+            ROUTER_STATS.record_call(route, time.time() - start, prompt, None)
+            return None
+
+    ROUTER_STATS.record_call(route, time.time() - start, prompt, content, usage)
+    record_llm_usage(len(json.dumps(payload)), len((content or "").encode("utf-8")), usage)
+
+    await asyncio.to_thread(LLM_CACHE.put, payload, content, time.time() - start)
+    return content
+
+async def call_routed_async(prompt, route, parse, deadline=None, bypass_cache=False, answer_key="answer"):
+    """
+    Async version of quiz_solver.call_routed
+    """
+    while True:
+        reply = await call_ai_async(prompt, bypass_cache=bypass_cache, deadline=deadline, answer_key=answer_key, route=route)
+        result = parse(reply) if reply else None
+        reason = escalation_reason(reply, result)
+        stronger = escalate(route, reason, deadline) if reason else None
+        if stronger is None:
+            return result, route
+        route = stronger
+
+async def solve_with_ai_async(instructions, files, question_type, submit_url, previous_attempts=None, deadline=None, route_name=None):
+    """
+    Async version of quiz_solver.solve_with_ai
+    """
+    prompt = build_prompt(instructions, files, question_type, submit_url, previous_attempts)
+    route = choose_route(route_name or question_type, prompt, previous_attempts)
+    solution, route = await call_routed_async(
+        prompt, route, lambda reply: parse_ai_response(reply, submit_url), deadline,
+        bypass_cache=LLM_CACHE_BYPASS_ON_RETRY and bool(previous_attempts)
+    )
+    return tag_route(solution, route)
+
+async def read_ai_stream_async(response, start, answer_key="answer"):
+    """
+    Async version of quiz_solver.read_ai_stream; returning early leaves the
+    stream context and drops the rest of the completion
+    """
+    scanner = JSONAnswerScanner(answer_key)
+    first_token = None
+    async for line in response.aiter_lines():
+        delta = parse_sse_line(line)
+        if delta is STREAM_DONE:
+            break
+        if delta is None:
+            continue
+        if first_token is None:
+            first_token = time.time()
+        if scanner.feed(delta):
+            break
+
+    now = time.time()
+    AI_STREAM_TIMINGS.record(
+        first_token - start if first_token else None,
+        now - start if scanner.result else None,
+        now - start,
+        scanner.result is not None
+    )
+    return scanner.reply_text()
+
+async def download_file_async(url, end_time):
+    """
+    Async version of file_pipeline.download_and_parse, sharing its cache
+    """
+    with span("file", url=url) as current:
+        try:
+            entry = await asyncio.to_thread(DOWNLOAD_CACHE.lookup, url)
+            content = None
+            if entry and DOWNLOAD_CACHE.is_fresh(entry):
+                await asyncio.to_thread(DOWNLOAD_CACHE.touch, url, False)
+                content_hash, content_type = entry["hash"], entry["content_type"]
+            else:
+                async with STAGE_LIMITS["download"]:
+                    logger.info(f"Downloading file: {url}")
+                    headers = DOWNLOAD_CACHE.conditional_headers(entry)
+                    response = await DOWNLOAD_RETRY.acall(
+                        url, lambda timeout: http_client.aget(url, timeout=timeout, headers=headers), end_time
+                    )
+                if response.status_code == 304 and entry:
+                    await asyncio.to_thread(DOWNLOAD_CACHE.touch, url, True, response.headers)
+                    content_hash, content_type = entry["hash"], entry["content_type"]
+                else:
+                    response.raise_for_status()
+                    content = response.content
+                    content_type = response.headers.get("content-type", "unknown")
+                    content_hash = await asyncio.to_thread(DOWNLOAD_CACHE.store, url, content, response.headers)
+                    if DOWNLOAD_CACHE.has_blob(content_hash):
+                        # Parse from the blob file rather than pickling the body to the pool
+                        content = None
+                    del response
+
+            # Parsing is CPU-bound: a thread waits on the process pool, off the event loop
+            return await asyncio.to_thread(parse_with_cache, url, content_hash, content, content_type, end_time)
+        except Exception as e:
+            current.fail(e)
+            logger.error(f"Error processing file {url}: {e}")
+            return {"url": url, "error": str(e)}
+
+async def process_files_async(instructions, deadline=FILE_DEADLINE, file_urls=None):
+    """
+    Download and parse the referenced files concurrently, dropping any
+    that miss the deadline; file_urls from the page extraction skip the
+    text scan
+    """
+    if file_urls is None:
+        file_urls = find_file_urls(instructions)
+    file_urls = file_urls[:FILE_MAX_COUNT]
+    if not file_urls:
+        return []
+
+    end_time = time.time() + deadline
+    with span("files", count=len(file_urls)):
+        tasks = [asyncio.create_task(download_file_async(url, end_time)) for url in file_urls]
+        await asyncio.wait(tasks, timeout=deadline)
+
+    processed_files = []
+    for url, task in zip(file_urls, tasks):
+        if task.done():
+            processed_files.append(task.result())
+        else:
+            task.cancel()
+            logger.warning(f"Dropping {url}, not ready within {deadline}s")
+            processed_files.append({"url": url, "error": f"Timed out after {deadline}s"})
+    return processed_files
+
+async def submit_answer_async(submit_url, answer_data, deadline=None):
+    """
+    Async version of quiz_pipeline.submit_answer
+    """
+    async with STAGE_LIMITS["submit"]:
+        try:
+            logger.info(f"Submitting answer to: {submit_url}")
+            response = await SUBMIT_RETRY.acall(
+                submit_url,
+                lambda timeout: http_client.apost(submit_url, json=answer_data, timeout=timeout),
+                deadline
+            )
+            return read_submission_response(response)
+        except Exception as e:
+            logger.error(f"Error submitting answer to {submit_url}: {e}")
+            return {"error": str(e)}
+
+async def solve_with_local_compute_async(instructions, files, submit_url, deadline=None):
+    """
+    Async version of quiz_solver.solve_with_local_compute
+    """
+    if not LOCAL_COMPUTE_ENABLED or not tabular_files(files):
+        return None
+    prompt = build_plan_prompt(instructions, files)
+    plan, route = await call_routed_async(prompt, choose_route("plan", prompt), parse_plan, deadline, answer_key="operation")
+    if not plan:
+        logger.info("No executable plan from the model, answering directly")
+        return None
+    # pandas work runs off the event loop
+    return tag_route(await asyncio.to_thread(solve_locally, plan, files, submit_url), route)
+
+async def solve_with_code_execution_async(instructions, files, submit_url, deadline=None):
+    """
+    Async version of quiz_solver.solve_with_code_execution
+    """
+    if not SANDBOX_ENABLED or not usable_files(files):
+        return None
+    stage_dir, staged = await asyncio.to_thread(stage_files, files)
+    try:
+        prompt = build_code_prompt(instructions, files, staged)
+        code, route = await call_routed_async(prompt, choose_route("code", prompt), extract_code, deadline, answer_key=None)
+        if not code:
+            logger.info("No code from the model, answering directly")
+            return None
+        return tag_route(await asyncio.to_thread(run_generated_code, code, staged, submit_url, deadline), route)
+    finally:
+        clear_stage(stage_dir)
+
+async def solve_quiz_async(quiz_data):
+    """
+    Async version of quiz_solver.solve_quiz_with_ai
+    """
+    try:
+        instructions, parsed_info, submit_url = prepare_quiz(quiz_data)
+        if not RACE_ENABLED:
+            return await solve_sequentially_async(quiz_data, instructions, parsed_info, submit_url)
+
+        pool = candidate_pool(quiz_data)
+        fallback = take_fallback(quiz_data, pool)
+        if fallback:
+            return fallback
+
+        strategies = build_strategies_async(quiz_data, instructions, parsed_info, submit_url, pool)
+        return await arace(strategies, pool, quiz_data.get("deadline"))
+    except Exception as e:
+        logger.error(f"Error in solve_quiz_async: {e}")
+        return None
+
+def build_strategies_async(quiz_data, instructions, parsed_info, submit_url, pool):
+    """
+    Async version of quiz_solver.build_strategies
+    """
+    previous_attempts = quiz_data.get("previous_attempts")
+    deadline = quiz_data.get("deadline")
+    question_type = parsed_info["question_type"]
+    extensions = {file_extension(url) for url in parsed_info["file_urls"]}
+
+    async def files():
+        return await pool.afiles(lambda: process_files_async(instructions, file_urls=parsed_info["file_urls"]))
+
+    async def ask_model(framing):
+        return await solve_with_ai_async(
+            instructions, await files(), framing, submit_url, previous_attempts, deadline, question_type
+        )
+
+    async def rule_based():
+        return simple_solver(instructions, submit_url)
+
+    async def local_compute():
+        return await solve_with_local_compute_async(instructions, await files(), submit_url, deadline)
+
+    async def code_exec():
+        return await solve_with_code_execution_async(instructions, await files(), submit_url, deadline)
+
+    strategies = {
+        "rule_based": rule_based,
+        "local_compute": local_compute,
+        "code_exec": code_exec,
+        "llm": lambda: ask_model(question_type),
+        "llm_alt": lambda: ask_model("unknown"),
+    }
+    names = plan_strategies(
+        question_type, previous_attempts,
+        bool(extensions & LOCAL_COMPUTE_TYPES), bool(extensions & CODE_EXEC_TYPES), CODE_EXEC_QUESTION_TYPES
+    )
+    return {name: strategies[name] for name in names}
+
+async def solve_sequentially_async(quiz_data, instructions, parsed_info, submit_url):
+    """
+    Async version of quiz_solver.solve_sequentially
+    """
+    processed_files = await process_files_async(instructions, file_urls=parsed_info["file_urls"])
+
+    if parsed_info["question_type"] == "calculation" and not quiz_data.get("previous_attempts"):
+        with span("local_compute"):
+            solution = await solve_with_local_compute_async(
+                instructions, processed_files, submit_url, quiz_data.get("deadline")
+            )
+        if solution:
+            return solution
+
+    if parsed_info["question_type"] in CODE_EXEC_QUESTION_TYPES and not quiz_data.get("previous_attempts"):
+        with span("code_exec"):
+            solution = await solve_with_code_execution_async(
+                instructions, processed_files, submit_url, quiz_data.get("deadline")
+            )
+        if solution:
+            return solution
+
+    solution = await solve_with_ai_async(
+        instructions, processed_files, parsed_info["question_type"], submit_url,
+        quiz_data.get("previous_attempts"), quiz_data.get("deadline")
+    )
+    if not solution:
+        logger.error("AIPIPE returned no usable response")
+    return solution
+
+
+# -----------------------------------
+# Full async quiz run
+# -----------------------------------
+async def run_quiz_async(quiz_url, start_time, stages=None):
+    """
+    Async version of quiz_pipeline.run_quiz, following the quiz chain
+    """
+    scheduler = ChainScheduler(start_time)
+    hops = []
+    current_url = quiz_url
+    result, status = {"error": "Time budget exhausted before first hop"}, 500
+
+    while current_url and scheduler.can_start_hop(len(hops)):
+        hop_stages = {}
+        with span("hop", url=current_url):
+            result, status, next_url = await run_hop_async(current_url, start_time, scheduler, hop_stages)
+        record_hop(hops, stages, current_url, status, hop_stages)
+        if status != 200:
+            break
+        current_url = next_url
+
+    return finish_chain(result, status, hops, start_time)
+
+async def run_hop_async(quiz_url, start_time, scheduler, stages):
+    """
+    Async version of quiz_pipeline.run_hop
+    """
+    logger.info(f"Processing quiz URL: {quiz_url}")
+
+    try:
+        with timed_stage(stages, "fetch"):
+            html_content = await fetch_quiz_page_async(quiz_url)
+        if not html_content:
+            return {"error": "Failed to fetch quiz page"}, 500, None
+
+        with timed_stage(stages, "parse"):
+            quiz_data = await asyncio.to_thread(parse_quiz_content, html_content, quiz_url)
+        if not quiz_data:
+            return {"error": "Failed to parse quiz content"}, 500, None
+
+        start_attempts(quiz_data, scheduler, stages)
+        while True:
+            attempt_stages = {}
+            stages["attempts"].append(attempt_stages)
+            attempt_start = time.time()
+
+            with timed_stage(attempt_stages, "solve"):
+                ai_solution = await solve_quiz_async(quiz_data)
+            if not ai_solution:
+                return {"error": "AI failed to solve quiz"}, 500, None
+
+            answer_payload = build_answer_payload(quiz_url, ai_solution)
+
+            submit_url = ai_solution.get("submit_url") or quiz_data.get("submit_url")
+            if not submit_url:
+                return {"error": "No submit URL found"}, 500, None
+
+            with timed_stage(attempt_stages, "submit"):
+                submission_result = await submit_answer_async(submit_url, answer_payload, quiz_data["deadline"])
+
+            action, next_url = finish_attempt(quiz_data, scheduler, stages, ai_solution, submission_result, attempt_start)
+            if action != "retry":
+                break
+
+        result, status = finish_hop(start_time, quiz_data, submit_url, ai_solution, submission_result)
+        return result, status, next_url
+
+    except Exception as e:
+        logger.error(f"Unexpected error in quiz endpoint: {e}")
+        return {"error": "Internal server error", "details": str(e)}, 500, None
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the file pipeline for one quiz request.
+
+Generates CSV files, serves them from a local HTTP server and runs
+file_pipeline.process_files over them in a fresh child process per run.
+Reports the Python allocation peak (tracemalloc), the child's peak RSS and
+the peak RSS of its parse workers.
+
+    python bench_memory.py --rows 500000 --files 3 --runs 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+
+def write_csv(path, rows):
+    with open(path, "w") as f:
+        f.write("id,region,product,amount,quantity\n")
+        regions = ("North", "South", "East", "West")
+        for i in range(rows):
+            f.write(f"{i},{regions[i % 4]},item{i % 97},{(i * 37) % 10000 / 100},{i % 13}\n")
+
+
+def serve(directory):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def child(urls):
+    """One measured run: download and parse every URL as a request would"""
+    import resource
+    import tracemalloc
+    import file_pipeline
+
+    tracemalloc.start()
+    start = time.time()
+    results = file_pipeline.process_files(urls, deadline=600)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    if file_pipeline._parse_pool is not None:
+        file_pipeline._parse_pool.shutdown(wait=True)
+
+    # ru_maxrss is in KiB on Linux
+    print(json.dumps({
+        "elapsed_s": round(elapsed, 2),
+        "errors": [r["error"] for r in results if "error" in r],
+        "tracemalloc_peak_mb": round(peak / 2 ** 20, 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "parse_workers_rss_peak_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000, help="rows per generated CSV")
+    parser.add_argument("--files", type=int, default=3, help="files per request")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as cache_dir:
+        for n in range(args.files):
+            write_csv(os.path.join(data_dir, f"data{n}.csv"), args.rows)
+        size_mb = sum(os.path.getsize(os.path.join(data_dir, f)) for f in os.listdir(data_dir)) / 2 ** 20
+        server = serve(data_dir)
+        urls = [f"http://127.0.0.1:{server.server_port}/data{n}.csv" for n in range(args.files)]
+        print(f"{args.files} files, {size_mb:.1f} MB total")
+
+        for run in range(args.runs):
+            # A fresh cache directory per run so every run downloads and parses
+            env = dict(os.environ, DOWNLOAD_CACHE_DIR=os.path.join(cache_dir, str(run)),
+                       AIPIPE_TOKEN=os.environ.get("AIPIPE_TOKEN", "bench"))
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", *urls],
+                env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            if output.returncode != 0:
+                print(output.stderr)
+                sys.exit(output.returncode)
+            print(f"run {run + 1}: {output.stdout.strip().splitlines()[-1]}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
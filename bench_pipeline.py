@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of the quiz service.
+
+Starts three things locally: a fake quiz server, a stand-in for the aipipe
+chat-completions API, and the service itself (app.py, or async_app.py with
+--mode async). The fake quiz server has pages whose instructions are
+written by JavaScript, generated CSV files and a grader that hands out
+chained next URLs. The harness then submits quiz requests at a fixed
+concurrency, waits for each job and reports p50/p95/p99 per stage,
+throughput, accuracy and the peak RSS of the service's process tree.
+
+    python bench_pipeline.py --requests 20 --concurrency 4 --rows 100000 --llm-latency 0.5
+    python bench_pipeline.py --replay recorded.jsonl --max-p95 30 --json bench.json
+
+--replay takes JSON lines with a "url" field (the /quiz request bodies).
+Only the URL path is kept: it is served by the fake quiz server, so
+recorded traffic replays without network access. The run exits with
+status 1 if any job fails or a --max-* threshold is exceeded, which is
+how CI catches regressions.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import base64
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+EMAIL = "bench@example.com"
+SECRET = "bench-secret"
+
+_FILE_URL = re.compile(r'https?://[^\s"\'<>]+/data/[^\s"\'<>]+\.csv')
+_SECRET_CODE = re.compile(r"secret code is (\w+)")
+
+
+# -----------------------------------
+# Fake quiz server
+# -----------------------------------
+class QuizSite:
+    """
+    Quizzes derived from the URL path, so any recorded path is a valid
+    quiz. Even steps ask for a column sum over a generated CSV; odd steps
+    ask for a code written on the page.
+    """
+
+    def __init__(self, rows, chain, render):
+        self.rows = rows
+        self.chain = chain
+        self.render = render
+        self.base = None
+        self._csv = {}
+        self._lock = threading.Lock()
+        self.graded = {"correct": 0, "incorrect": 0}
+
+    def _seed(self, path):
+        return int(hashlib.sha256(path.encode()).hexdigest()[:8], 16)
+
+    def csv(self, name):
+        with self._lock:
+            if name not in self._csv:
+                rng = random.Random(name)
+                lines = ["id,region,amount,quantity"]
+                for i in range(self.rows):
+                    lines.append(f"{i},{('North', 'South', 'East', 'West')[i % 4]},{rng.randint(1, 1000)},{i % 13}")
+                self._csv[name] = ("\n".join(lines) + "\n").encode()
+            return self._csv[name]
+
+    def expected(self, quiz_path):
+        step = int(quiz_path.rsplit("/", 1)[-1]) if quiz_path.rsplit("/", 1)[-1].isdigit() else 0
+        seed = self._seed(quiz_path)
+        if step % 2 == 0:
+            data = self.csv(f"d{seed % 1000}").decode().splitlines()[1:]
+            return sum(int(line.split(",")[2]) for line in data)
+        return f"CODE{seed % 100000}"
+
+    def instructions(self, quiz_path):
+        step = int(quiz_path.rsplit("/", 1)[-1]) if quiz_path.rsplit("/", 1)[-1].isdigit() else 0
+        seed = self._seed(quiz_path)
+        submit = f"{self.base}/submit"
+        payload = json.dumps({"email": "your email", "secret": "your secret", "url": self.base + quiz_path, "answer": "..."})
+        if step % 2 == 0:
+            question = (f"Download {self.base}/data/d{seed % 1000}.csv. "
+                        f"What is the sum of the amount column?")
+        else:
+            question = f"The secret code is CODE{seed % 100000}. What is the secret code shown on this page?"
+        return f"<p>Q{step}. {question}</p><p>Post your answer to {submit} with this JSON payload:</p><pre>{payload}</pre>"
+
+    def page(self, quiz_path):
+        body = self.instructions(quiz_path)
+        if self.render == "static":
+            content = f'<div id="result">{body}</div>'
+        elif self.render == "js":
+            # Built by string operations only a real browser can run
+            parts = json.dumps([body[i:i + 40] for i in range(0, len(body), 40)])
+            content = f'<div id="result"></div><script>document.querySelector("#result").innerHTML = {parts}.join("");</script>'
+        else:
+            encoded = base64.b64encode(body.encode()).decode()
+            content = f'<div id="result"></div><script>document.querySelector("#result").innerHTML = atob(`{encoded}`);</script>'
+        return f"<html><body>{content}</body></html>".encode()
+
+    def grade(self, submission):
+        quiz_path = urlparse(submission.get("url", "")).path
+        expected = self.expected(quiz_path)
+        answer = submission.get("answer")
+        try:
+            correct = abs(float(answer) - float(expected)) < 1e-6 if isinstance(expected, int) else str(answer) == expected
+        except (TypeError, ValueError):
+            correct = False
+        with self._lock:
+            self.graded["correct" if correct else "incorrect"] += 1
+
+        head, _, step = quiz_path.rpartition("/")
+        next_step = int(step) + 1 if step.isdigit() else 1
+        next_url = f"{self.base}{head}/{next_step}" if next_step < self.chain else None
+        return {"correct": correct, "url": next_url, "reason": None if correct else f"Expected {expected}"}
+
+
+def quiz_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path.startswith("/data/") and path.endswith(".csv"):
+                self._send(200, site.csv(path[len("/data/"):-len(".csv")]), "text/csv")
+            else:
+                self._send(200, site.page(path), "text/html; charset=utf-8")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                result = site.grade(json.loads(body))
+            except ValueError:
+                self._send(400, b'{"error": "bad json"}', "application/json")
+                return
+            self._send(200, json.dumps(result).encode(), "application/json")
+
+    return Handler
+
+
+# -----------------------------------
+# Stand-in for the chat-completions API
+# -----------------------------------
+def fake_reply(prompt):
+    """What a well-behaved model would say to each of the service's prompts"""
+    file_url = _FILE_URL.search(prompt)
+    if "planning a data calculation" in prompt:
+        if not file_url:
+            return json.dumps({"operation": None})
+        return json.dumps({"file": file_url.group(0), "sheet": None, "steps": [],
+                           "operation": {"type": "sum", "column": "amount"}, "round": None})
+    if "Write Python code" in prompt and file_url:
+        return f"```python\nresult = int(pd.read_csv(files[{file_url.group(0)!r}])['amount'].sum())\n```"
+    code = _SECRET_CODE.search(prompt)
+    return json.dumps({"answer": code.group(1) if code else 0, "reasoning": "benchmark stand-in"})
+
+
+def llm_handler(latency, jitter, chunk_delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = payload["messages"][-1]["content"]
+            reply = fake_reply(prompt)
+            time.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+            usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(reply) // 4}
+
+            if not payload.get("stream"):
+                body = json.dumps({"choices": [{"message": {"role": "assistant", "content": reply}}],
+                                   "usage": usage}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                for i in range(0, len(reply), 16):
+                    event = {"choices": [{"delta": {"content": reply[i:i + 16]}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stops reading once it has the answer
+            self.close_connection = True
+
+    return Handler
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# -----------------------------------
+# Service under test
+# -----------------------------------
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(mode, port, llm_url, work_dir):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        STUDENT_EMAIL=EMAIL,
+        STUDENT_SECRET=SECRET,
+        AIPIPE_TOKEN="bench",
+        AIPIPE_URL=llm_url,
+        JOB_DB_PATH=os.path.join(work_dir, "jobs.db"),
+        DOWNLOAD_CACHE_DIR=os.path.join(work_dir, "downloads"),
+        LLM_CACHE_PATH=os.path.join(work_dir, "llm_cache.db"),
+        PDF_CACHE_DIR=os.path.join(work_dir, "pdf_pages"),
+        CODE_EXEC_DIR=os.path.join(work_dir, "sandbox"),
+    )
+    env.setdefault("LLM_CACHE_ENABLED", "0")  # measure the model path, not cache hits
+    script = "async_app.py" if mode == "async" else "app.py"
+    here = os.path.dirname(os.path.abspath(__file__))
+    log = open(os.path.join(work_dir, "service.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(here, script)], cwd=here, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+
+    for _ in range(600):
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with {process.returncode}; see {log.name}")
+        try:
+            urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Service did not become healthy within 60s")
+
+
+def tree_rss_mb(root_pid):
+    """Resident memory of a process and all its descendants (Linux /proc)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+    total_kb, pending = 0, [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+# -----------------------------------
+# Load generation and reporting
+# -----------------------------------
+def post_json(url, body, timeout=10):
+    request = Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run_one(service_url, quiz_url, poll, timeout):
+    """Submit one quiz and wait for its job record"""
+    queued = post_json(f"{service_url}/quiz", {"email": EMAIL, "secret": SECRET, "url": quiz_url})
+    job_url = f"{service_url}/jobs/{queued['job_id']}"
+    end = time.time() + timeout
+    while time.time() < end:
+        with urlopen(job_url, timeout=10) as response:
+            job = json.loads(response.read())
+        if job["status"] in ("completed", "failed", "rejected"):
+            return job
+        time.sleep(poll)
+    return {"status": "timeout", "url": quiz_url}
+
+
+def job_samples(job, samples):
+    """Add a finished job's stage and span durations (seconds) to samples"""
+    def add(name, value):
+        if isinstance(value, (int, float)):
+            samples.setdefault(name, []).append(float(value))
+
+    if job.get("finished") and job.get("created"):
+        add("end_to_end", job["finished"] - job["created"])
+    if job.get("started") and job.get("created"):
+        add("queue_wait", job["started"] - job["created"])
+    stages = job.get("stages") or {}
+    for key, hop in stages.items():
+        if not key.startswith("hop_"):
+            continue
+        for stage in ("fetch", "parse"):
+            add(f"stage.{stage}", hop.get(stage))
+        for attempt in hop.get("attempts") or []:
+            for stage, seconds in attempt.items():
+                add(f"stage.{stage}", seconds)
+    for record in (stages.get("trace") or {}).get("spans", []):
+        add(f"span.{record['name']}", record["duration_ms"] / 1000)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    return {
+        name: {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(max(values), 3),
+        }
+        for name, values in sorted(samples.items()) if values
+    }
+
+
+def quiz_urls(args, base):
+    if args.replay:
+        with open(args.replay) as f:
+            paths = [urlparse(json.loads(line)["url"]).path or "/" for line in f
+                     if line.strip() and "url" in json.loads(line)]
+        if not paths:
+            sys.exit(f"No request bodies with a url in {args.replay}")
+        paths = (paths * (args.requests // len(paths) + 1))[:args.requests] if args.requests else paths
+    else:
+        paths = [f"/quiz/{n}/0" for n in range(args.requests)]
+    return [base + path for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--requests", type=int, default=20, help="quiz requests to send (0 with --replay: one per line)")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--replay", help="JSON lines of /quiz request bodies to replay")
+    parser.add_argument("--chain", type=int, default=2, help="quizzes per chain before the grader stops")
+    parser.add_argument("--rows", type=int, default=10000, help="rows per generated CSV")
+    parser.add_argument("--render", choices=("atob", "js", "static"), default="atob",
+                        help="atob: decoded without a browser; js: needs the Playwright browser")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds before the model replies")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.005, help="seconds between streamed chunks")
+    parser.add_argument("--job-timeout", type=float, default=300)
+    parser.add_argument("--json", help="write the report here as JSON")
+    parser.add_argument("--max-p95", type=float, help="fail if end-to-end p95 exceeds this many seconds")
+    parser.add_argument("--max-rss-mb", type=float, help="fail if peak RSS exceeds this many MB")
+    parser.add_argument("--min-throughput", type=float, help="fail below this many jobs per second")
+    args = parser.parse_args()
+
+    site = QuizSite(args.rows, args.chain, args.render)
+    quiz_server = serve(quiz_handler(site))
+    site.base = f"http://127.0.0.1:{quiz_server.server_port}"
+    llm_server = serve(llm_handler(args.llm_latency, args.llm_jitter, args.llm_chunk_delay))
+    llm_url = f"http://127.0.0.1:{llm_server.server_port}/v1/chat/completions"
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        port = free_port()
+        service = start_service(args.mode, port, llm_url, work_dir)
+        sampler = RssSampler(service.pid)
+        sampler.start()
+        try:
+            urls = quiz_urls(args, site.base)
+            service_url = f"http://127.0.0.1:{port}"
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                jobs = list(pool.map(lambda url: run_one(service_url, url, 0.1, args.job_timeout), urls))
+            elapsed = time.time() - start
+        finally:
+            sampler.stop()
+            service.terminate()
+            try:
+                service.wait(10)
+            except subprocess.TimeoutExpired:
+                service.kill()
+            quiz_server.shutdown()
+            llm_server.shutdown()
+
+    samples = {}
+    for job in jobs:
+        job_samples(job, samples)
+    failed = [j for j in jobs if j.get("status") != "completed"]
+    graded = site.graded["correct"] + site.graded["incorrect"]
+    report = {
+        "mode": args.mode,
+        "requests": len(jobs),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_jobs_per_s": round(len(jobs) / elapsed, 3) if elapsed else None,
+        "failed_jobs": len(failed),
+        "submissions": graded,
+        "accuracy": round(site.graded["correct"] / graded, 3) if graded else None,
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+        "latency_s": summarize(samples),
+    }
+
+    print(f"{report['requests']} requests, concurrency {args.concurrency}, mode {args.mode}: "
+          f"{report['elapsed_s']}s, {report['throughput_jobs_per_s']} jobs/s, "
+          f"{report['failed_jobs']} failed, accuracy {report['accuracy']}, peak RSS {report['peak_rss_mb']} MB")
+    print(f"{'metric':<24}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, row in report["latency_s"].items():
+        print(f"{name:<24}{row['count']:>7}{row['p50']:>9}{row['p95']:>9}{row['p99']:>9}{row['max']:>9}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    problems = []
+    if failed:
+        problems.append(f"{len(failed)} jobs did not complete")
+    end_to_end = report["latency_s"].get("end_to_end")
+    if args.max_p95 is not None and end_to_end and end_to_end["p95"] > args.max_p95:
+        problems.append(f"end-to-end p95 {end_to_end['p95']}s > {args.max_p95}s")
+    if args.max_rss_mb is not None and report["peak_rss_mb"] > args.max_rss_mb:
+        problems.append(f"peak RSS {report['peak_rss_mb']} MB > {args.max_rss_mb} MB")
+    if args.min_throughput is not None and (report["throughput_jobs_per_s"] or 0) < args.min_throughput:
+        problems.append(f"throughput {report['throughput_jobs_per_s']} jobs/s < {args.min_throughput}")
+    if problems:
+        print("FAIL: " + "; ".join(problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Pool configuration
+# -----------------------------------
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 2))
+BROWSER_MAX_USES = int(os.environ.get("BROWSER_MAX_USES", 50))
+BROWSER_CHECKOUT_TIMEOUT = float(os.environ.get("BROWSER_CHECKOUT_TIMEOUT", 60))
+BROWSER_HEALTH_INTERVAL = float(os.environ.get("BROWSER_HEALTH_INTERVAL", 30))
+
+
+# -----------------------------------
+# A single warm browser context
+# -----------------------------------
+class BrowserSlot:
+    """
+    One warm Chromium browser + context, driven by its own thread.
+
+    Playwright's sync API is bound to the thread that started it, so every
+    slot owns a Playwright instance and runs all render jobs on that thread.
+    """
+
+    def __init__(self, index, max_uses=BROWSER_MAX_USES, health_interval=BROWSER_HEALTH_INTERVAL):
+        self.index = index
+        self.max_uses = max_uses
+        self.health_interval = health_interval
+        self.uses = 0
+        self.total_uses = 0
+        self.recycles = 0
+        self.crashes = 0
+        self._jobs = queue.Queue()
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._thread = threading.Thread(target=self._run, name=f"browser-slot-{index}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """Queue fn(context) on the slot thread and return a Future"""
+        future = Future()
+        self._jobs.put((fn, future))
+        return future
+
+    def stop(self):
+        self._jobs.put((None, None))
+
+    def _run(self):
+        try:
+            from playwright.sync_api import sync_playwright
+            self._playwright = sync_playwright().start()
+            self._launch()
+        except Exception as e:
+            logger.error(f"Browser slot {self.index} failed to warm up: {e}")
+
+        while True:
+            try:
+                fn, future = self._jobs.get(timeout=self.health_interval)
+            except queue.Empty:
+                self._health_check()
+                continue
+
+            if fn is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                if not self._is_healthy():
+                    self._recycle("unhealthy before checkout")
+                if not self._is_healthy():
+                    raise RuntimeError(f"Browser slot {self.index} is unavailable")
+                result = fn(self._context)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+                if not self._is_healthy():
+                    self.crashes += 1
+                    self._recycle(f"crash: {e}")
+            finally:
+                self.uses += 1
+                self.total_uses += 1
+                self._reset_context()
+                if self.uses >= self.max_uses:
+                    self._recycle(f"reached {self.max_uses} uses")
+
+        self._close()
+        if self._playwright:
+            self._playwright.stop()
+
+    def _launch(self):
+        if not self._playwright:
+            raise RuntimeError("Playwright is not running")
+        # Launch browser in headless mode for Docker
+        self._browser = self._playwright.chromium.launch(headless=True)
+        self._context = self._browser.new_context()
+        self.uses = 0
+        logger.info(f"Browser slot {self.index} is warm")
+
+    def _close(self):
+        try:
+            if self._browser:
+                self._browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser slot {self.index}: {e}")
+        self._browser = None
+        self._context = None
+
+    def _recycle(self, reason):
+        logger.info(f"Recycling browser slot {self.index}: {reason}")
+        self.recycles += 1
+        self._close()
+        try:
+            self._launch()
+        except Exception as e:
+            logger.error(f"Browser slot {self.index} failed to relaunch: {e}")
+
+    def _reset_context(self):
+        """Drop per-quiz state so the next checkout starts clean"""
+        try:
+            if self._context:
+                self._context.clear_cookies()
+                for page in list(self._context.pages):
+                    page.close()
+        except Exception as e:
+            logger.warning(f"Error resetting browser slot {self.index}: {e}")
+
+    def _is_healthy(self):
+        return bool(self._browser and self._context and self._browser.is_connected())
+
+    def _health_check(self):
+        """Idle probe: open and close a blank page, recycle on failure"""
+        try:
+            if not self._is_healthy():
+                raise RuntimeError("browser disconnected")
+            page = self._context.new_page()
+            page.close()
+        except Exception as e:
+            self.crashes += 1
+            self._recycle(f"health check failed: {e}")
+
+    def stats(self):
+        return {
+            "index": self.index,
+            "uses": self.uses,
+            "total_uses": self.total_uses,
+            "recycles": self.recycles,
+            "crashes": self.crashes,
+        }
+
+
+# -----------------------------------
+# Pool of warm browser slots
+# -----------------------------------
+class BrowserPool:
+    """
+    Fixed-size pool of warm browser slots checked out per render.
+
+    Slots are started lazily on first use so that gunicorn workers launch
+    their own browsers after forking.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES, checkout_timeout=BROWSER_CHECKOUT_TIMEOUT):
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self._slots = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._in_use = 0
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.size):
+                slot = BrowserSlot(i, max_uses=self.max_uses)
+                self._slots.append(slot)
+                self._idle.put(slot)
+            self._started = True
+            atexit.register(self.shutdown)
+        logger.info(f"Started browser pool with {self.size} slots")
+
+    def run(self, fn, timeout=None):
+        """
+        Check out a slot, run fn(context) on it and return the result
+        """
+        self.start()
+
+        wait_start = time.time()
+        try:
+            slot = self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No browser available after {self.checkout_timeout}s")
+        wait_time = time.time() - wait_start
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+
+        try:
+            return slot.submit(fn).result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(slot)
+
+    def shutdown(self):
+        with self._lock:
+            for slot in self._slots:
+                slot.stop()
+            self._slots = []
+            self._idle = queue.Queue()
+            self._started = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "started": self._started,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "avg_wait_ms": round(self._total_wait / self._checkouts * 1000, 2) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "slots": [slot.stats() for slot in self._slots],
+            }
+
+
+BROWSER_POOL = BrowserPool()
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from download_cache import DOWNLOAD_CACHE
+from file_pipeline import download_file, file_extension
+from prompt_budget import PROMPT_TOKEN_BUDGET, render_files, log_prompt_size
+from sandbox import SANDBOX_POOL, SANDBOX_WALL_SECONDS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Code execution configuration
+# -----------------------------------
+CODE_EXEC_TYPES = {"csv", "xlsx", "xls", "json", "txt", "pdf"}
+CODE_EXEC_DIR = os.environ.get("CODE_EXEC_DIR", ".cache/sandbox")  # holds one staging directory per run
+
+_CODE_BLOCK = re.compile(r"```(?:python|py)?\s*\n(.*?)```", re.DOTALL)
+
+
+def usable_files(files):
+    return [
+        f for f in files
+        if file_extension(f.get("url", "")) in CODE_EXEC_TYPES and "error" not in f
+    ]
+
+
+def stage_files(files, end_time=None):
+    """
+    Local paths for the generated code, as (stage_dir, {url: path}). Each
+    run gets its own directory under CODE_EXEC_DIR, which the caller
+    removes with clear_stage. Cached blobs are linked under a name with the
+    right extension; anything not in the cache is downloaded into it.
+    """
+    os.makedirs(CODE_EXEC_DIR, exist_ok=True)
+    stage_dir = tempfile.mkdtemp(prefix="stage-", dir=CODE_EXEC_DIR)
+    # mkdtemp creates 0700; the sandbox user must be able to read the files
+    os.chmod(stage_dir, 0o755)
+    staged = {}
+    try:
+        for file_info in usable_files(files):
+            url = file_info["url"]
+            content_hash = file_info.get("content_hash")
+            path = os.path.abspath(os.path.join(stage_dir, f"{content_hash or hashlib.sha256(url.encode()).hexdigest()}.{file_extension(url)}"))
+            if not os.path.lexists(path):
+                blob_path = DOWNLOAD_CACHE.blob_path(content_hash) if content_hash else None
+                if blob_path and os.path.exists(blob_path):
+                    try:
+                        os.link(blob_path, path)
+                    except OSError:
+                        os.symlink(os.path.abspath(blob_path), path)
+                else:
+                    with download_file(url, end_time or time.time() + 30)[0] as body, open(path, "wb") as f:
+                        shutil.copyfileobj(body, f, 1024 * 1024)
+            staged[url] = path
+    except BaseException:
+        clear_stage(stage_dir)
+        raise
+    return stage_dir, staged
+
+
+def clear_stage(stage_dir):
+    """Remove a run's staged files; hard links no longer pin evicted blobs"""
+    shutil.rmtree(stage_dir, ignore_errors=True)
+
+
+def build_code_prompt(instructions, files, staged):
+    """
+    Prompt asking for a Python snippet that computes the answer from the
+    staged files
+    """
+    files_text = render_files(files, instructions, PROMPT_TOKEN_BUDGET // 2)
+    prompt = f"""
+Write Python code that answers the quiz question below by processing the data files.
+
+QUIZ INSTRUCTIONS:
+{instructions}
+
+DATA FILES (previews only):
+{files_text}
+
+The code runs in a sandbox with CPU, memory and time limits; do not use the network. Available names:
+- files: dict mapping each file URL to a local path: {json.dumps(staged)}
+- pd (pandas), np (numpy), re, json, math; PyPDF2 can be imported for PDFs
+- mmap_file(path): read-only memory map of a file, for large text or binary scans
+
+Read the files from those paths (e.g. pd.read_csv(files[url], memory_map=True)) and work on the full data.
+Assign the final answer to a variable named `result` as a number, string, boolean, list or dict.
+Return ONLY the code in a single ```python block.
+"""
+    log_prompt_size(prompt, {"files": files_text})
+    return prompt
+
+
+def extract_code(ai_response):
+    """Python source from the model reply, or None"""
+    if not ai_response:
+        return None
+    match = _CODE_BLOCK.search(ai_response)
+    code = match.group(1) if match else ai_response
+    return code if "result" in code else None
+
+
+def run_generated_code(code, staged, submit_url, deadline=None):
+    """
+    Solution dict from running code in the sandbox, or None when it fails
+    """
+    wall_seconds = SANDBOX_WALL_SECONDS
+    if deadline is not None:
+        wall_seconds = min(wall_seconds, deadline - time.time() - 5)
+        if wall_seconds <= 0:
+            logger.warning("No time left to run generated code")
+            return None
+
+    with span("sandbox") as current:
+        reply = SANDBOX_POOL.run(code, staged, wall_seconds=wall_seconds)
+        if not reply.get("ok"):
+            current.fail(reply.get("error") or "failed")
+    if not reply.get("ok") or reply.get("result") is None:
+        logger.warning(f"Generated code failed: {reply.get('error') or 'no result set'}")
+        return None
+    logger.info(f"Sandbox answered {reply['result']!r}")
+    return {
+        "answer": reply["result"],
+        "reasoning": "Computed by generated code over the full data"
+                     + (f"; output: {reply['stdout'][-300:]}" if reply.get("stdout") else ""),
+        "submit_url": submit_url,
+    }
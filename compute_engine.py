@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+from ai_stream import JSONAnswerScanner
+from data_processor import DataProcessor
+from download_cache import DOWNLOAD_CACHE
+from file_pipeline import download_file, file_extension, save_frame
+from prompt_budget import PROMPT_TOKEN_BUDGET, render_files, log_prompt_size
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Local compute configuration
+# -----------------------------------
+LOCAL_COMPUTE_ENABLED = os.environ.get("LOCAL_COMPUTE_ENABLED", "1") == "1"
+LOCAL_COMPUTE_TYPES = {"csv", "xlsx", "xls", "json"}
+
+# Plan steps that transform the table before the final operation
+PLAN_STEPS = {"filter", "join", "dropna"}
+
+# Query strings come from the model: no attribute dunders, no local variables
+_UNSAFE_QUERY = re.compile(r"__|@|\bimport\b|\blambda\b")
+
+
+class PlanError(Exception):
+    """The model's plan cannot be executed against the downloaded data"""
+
+
+def tabular_files(files):
+    """Downloaded files the engine can load as a DataFrame"""
+    return [
+        f for f in files
+        if file_extension(f.get("url", "")) in LOCAL_COMPUTE_TYPES
+        and "error" not in f and "parse_error" not in f
+    ]
+
+
+# -----------------------------------
+# Phase 1: ask the model for an operation plan
+# -----------------------------------
+def build_plan_prompt(instructions, files):
+    """
+    Prompt asking for a small JSON plan instead of the answer itself
+    """
+    files_text = render_files(files, instructions, PROMPT_TOKEN_BUDGET // 2)
+    prompt = f"""
+You are planning a data calculation. Do NOT compute the answer yourself; a pandas engine will run your plan over the full files.
+
+QUIZ INSTRUCTIONS:
+{instructions}
+
+DATA FILES (previews only, the engine has every row):
+{files_text}
+
+Return ONLY a JSON object:
+{{
+    "file": "URL of the main table",
+    "sheet": "sheet name for Excel files, or null",
+    "steps": [
+        {{"type": "filter", "condition": "pandas query string, e.g. `amount` > 100 and region == 'North'"}},
+        {{"type": "join", "file": "URL of another table", "on": "shared column", "how": "inner|left"}},
+        {{"type": "dropna", "columns": ["column"]}}
+    ],
+    "operation": {{"type": "sum|mean|median|min|max|count|nunique", "column": "column name"}}
+        or {{"type": "groupby", "group_column": "...", "agg_column": "...", "agg_function": "sum|mean|count|min|max"}}
+        or {{"type": "filter", "condition": "query"}} to count matching rows,
+    "round": null or number of decimals the answer should have
+}}
+Use an empty "steps" list when no filtering or joining is needed.
+If the question cannot be answered by such a plan, return {{"operation": null}}.
+"""
+    log_prompt_size(prompt, {"files": files_text})
+    return prompt
+
+
+def parse_plan(ai_response):
+    """First JSON object with an "operation" key in the reply, or None"""
+    if not ai_response:
+        return None
+    scanner = JSONAnswerScanner(required_key="operation")
+    scanner.feed(ai_response)
+    plan = scanner.result
+    if not plan or not isinstance(plan.get("operation"), dict):
+        return None
+    return plan
+
+
+# -----------------------------------
+# Phase 2: run the plan locally
+# -----------------------------------
+def load_frame(file_info, sheet=None, end_time=None):
+    """
+    Full DataFrame for a downloaded file: the cached Parquet copy if there
+    is one, else the cached blob, else a fresh download. A CSV read from
+    the blob or the network is saved as Parquet for the next plan.
+    """
+    url = file_info["url"]
+    content_hash = file_info.get("content_hash")
+    extension = file_extension(url)
+
+    frame_path = DOWNLOAD_CACHE.frame_path(content_hash) if content_hash else None
+    if extension == "csv" and frame_path and os.path.exists(frame_path):
+        return pd.read_parquet(frame_path)
+
+    if content_hash and DOWNLOAD_CACHE.has_blob(content_hash):
+        source = DOWNLOAD_CACHE.blob_path(content_hash)
+    else:
+        source = download_file(url, end_time or time.time() + 30)[0]
+
+    if extension == "csv":
+        frame = pd.read_csv(source)
+        if frame_path:
+            save_frame(frame, frame_path)
+        return frame
+    if extension in ("xlsx", "xls"):
+        workbook = DataProcessor.open_workbook(source if isinstance(source, str) else source.read())
+        try:
+            return workbook.sheet(sheet or 0)
+        finally:
+            workbook.close()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = json.load(f)
+    else:
+        data = json.load(source)
+    if isinstance(data, dict):
+        # {"records": [...]} style wrappers: use the first list of rows
+        data = next((v for v in data.values() if isinstance(v, list)), [data])
+    return pd.DataFrame(data)
+
+
+def _check_columns(df, *columns):
+    missing = [c for c in columns if c is not None and c not in df.columns]
+    if missing:
+        raise PlanError(f"Unknown columns {missing}; available: {df.columns.tolist()}")
+
+
+def _check_query(condition):
+    if not isinstance(condition, str) or not condition.strip() or _UNSAFE_QUERY.search(condition):
+        raise PlanError(f"Refusing query condition: {condition!r}")
+
+
+def apply_step(df, step, frames):
+    kind = step.get("type")
+    if kind == "filter":
+        _check_query(step.get("condition"))
+        return df.query(step["condition"])
+    if kind == "join":
+        other = frames(step.get("file"))
+        _check_columns(df, step.get("on"))
+        _check_columns(other, step.get("on"))
+        return df.merge(other, on=step["on"], how=step.get("how", "inner"))
+    if kind == "dropna":
+        columns = step.get("columns") or None
+        if columns:
+            _check_columns(df, *columns)
+        return df.dropna(subset=columns)
+    raise PlanError(f"Unknown step type: {kind}")
+
+
+def to_answer(value, decimals=None):
+    """Turn a pandas/NumPy result into a JSON-friendly answer"""
+    if isinstance(value, dict):
+        return {str(k): to_answer(v, decimals) for k, v in value.items()}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        if decimals is not None:
+            return round(value, int(decimals))
+    return value
+
+
+def execute_plan(plan, files, end_time=None):
+    """
+    Run a plan over the full data and return the exact answer.
+
+    Raises PlanError when the plan does not fit the data.
+    """
+    by_url = {f["url"]: f for f in tabular_files(files)}
+    loaded = {}
+
+    def frames(url, sheet=None):
+        if url not in by_url:
+            raise PlanError(f"Plan refers to unknown file {url}")
+        if url not in loaded:
+            loaded[url] = load_frame(by_url[url], sheet, end_time)
+        return loaded[url]
+
+    df = frames(plan.get("file"), plan.get("sheet"))
+    for step in plan.get("steps") or []:
+        if step.get("type") not in PLAN_STEPS:
+            raise PlanError(f"Unknown step type: {step.get('type')}")
+        df = apply_step(df, step, frames)
+
+    operation = plan["operation"]
+    _check_columns(df, operation.get("column"), operation.get("group_column"), operation.get("agg_column"))
+    if operation.get("type") == "filter":
+        _check_query(operation.get("condition"))
+
+    result = DataProcessor.analyze_dataframe(df, operation)
+    if isinstance(result, dict) and "error" in result:
+        raise PlanError(result["error"])
+    return to_answer(result, plan.get("round"))
+
+
+def solve_locally(plan, files, submit_url, end_time=None):
+    """
+    Solution dict computed by the engine, or None to fall back to the
+    model answering directly
+    """
+    try:
+        start = time.time()
+        with span("plan.execute", operation=plan["operation"].get("type")):
+            answer = execute_plan(plan, files, end_time)
+        logger.info(f"Local compute answered {answer!r} in {time.time() - start:.2f}s with plan {plan}")
+        return {
+            "answer": answer,
+            "reasoning": f"Computed locally over the full data with plan: {json.dumps(plan, default=str)}",
+            "submit_url": submit_url,
+        }
+    except Exception as e:
+        logger.warning(f"Local compute failed, falling back to the model: {e}")
+        return None
@@ -1,74 +1,429 @@
 import pandas as pd
 import PyPDF2
 import io
+import os
+import re
 import base64
 import json
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import requests
 
+# -----------------------------------
+# CSV streaming configuration
+# -----------------------------------
+CSV_CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", 100000))
+CSV_ENGINE = os.environ.get("CSV_ENGINE", "pandas")  # "pyarrow" for Arrow's streaming reader
+CSV_CATEGORY_RATIO = float(os.environ.get("CSV_CATEGORY_RATIO", 0.5))  # unique/rows below this -> category
+CSV_MAX_TRACKED_VALUES = int(os.environ.get("CSV_MAX_TRACKED_VALUES", 10000))  # per text column
+
+# -----------------------------------
+# PDF extraction configuration
+# -----------------------------------
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", 4))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 8))  # below this, extract inline
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", ".cache/pdf_pages")
+
+PDF_SIGNATURES = (b"%PDF",)
+EXCEL_SIGNATURES = (b"PK\x03\x04", b"\xd0\xcf\x11\xe0")
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    """
+    Process pool for page extraction, created on first use and kept for
+    later PDFs. Uses spawn, like the file pipeline's parse pool.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
+
+
+def _pdf_stream(source):
+    return open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+
+
+def _pdf_hash(source):
+    digest = hashlib.sha256()
+    with _pdf_stream(source) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_pdf_pages(source, page_indexes):
+    """Text of the given 0-based pages; runs in a pool worker for large PDFs"""
+    with _pdf_stream(source) as f:
+        reader = PyPDF2.PdfReader(f)
+        return {i: reader.pages[i].extract_text() or "" for i in page_indexes}
+
+
+def _cached_pdf_pages(source, content_hash, page_indexes):
+    """
+    Page texts by 0-based index, read from the per-page cache where possible
+    and extracted (in parallel for many pages) otherwise
+    """
+    cache_dir = os.path.join(PDF_CACHE_DIR, content_hash)
+    texts = {}
+    missing = []
+    for i in page_indexes:
+        path = os.path.join(cache_dir, f"{i + 1}.txt")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                texts[i] = f.read()
+        else:
+            missing.append(i)
+    if not missing:
+        return texts
+    
+    # Inside a pool worker a nested pool would keep the worker, and so the
+    # parent, from ever exiting: stay inline
+    in_worker = multiprocessing.parent_process() is not None
+    if len(missing) < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1 or in_worker:
+        extracted = _extract_pdf_pages(source, missing)
+    else:
+        # Hand workers a path rather than pickling the bytes to each of them
+        tmp_path = None
+        if not isinstance(source, str):
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                tmp.write(source)
+            source = tmp_path = tmp.name
+        try:
+            batch = -(-len(missing) // PDF_WORKERS)
+            pool = _get_pdf_pool()
+            futures = [
+                pool.submit(_extract_pdf_pages, source, missing[start:start + batch])
+                for start in range(0, len(missing), batch)
+            ]
+            extracted = {}
+            for future in futures:
+                extracted.update(future.result())
+        finally:
+            if tmp_path:
+                os.remove(tmp_path)
+    
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for i, text in extracted.items():
+            fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_name, os.path.join(cache_dir, f"{i + 1}.txt"))
+    except OSError:
+        pass
+    texts.update(extracted)
+    return texts
+
+
+def _looks_numeric(cell):
+    try:
+        float(str(cell).replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+
+class LazyWorkbook:
+    """
+    Excel workbook whose sheets are parsed only when asked for.
+    
+    Opening it reads the sheet list; dimensions come from the sheet
+    metadata. Loaded sheets are cached per (sheet, columns, rows).
+    """
+    
+    def __init__(self, source):
+        self._excel = pd.ExcelFile(source if isinstance(source, str) else io.BytesIO(source))
+        self._sheets = {}
+    
+    @property
+    def sheet_names(self):
+        return list(self._excel.sheet_names)
+    
+    def dimensions(self):
+        """
+        {sheet: (rows, columns)} from sheet metadata, header row included;
+        None where the file does not record its dimensions
+        """
+        book = self._excel.book
+        dims = {}
+        for name in self.sheet_names:
+            if hasattr(book, "sheet_by_name"):
+                sheet = book.sheet_by_name(name)  # xlrd (.xls)
+                dims[name] = (sheet.nrows, sheet.ncols)
+            else:
+                sheet = book[name]  # openpyxl (.xlsx), read-only
+                dims[name] = (sheet.max_row, sheet.max_column)
+        return dims
+    
+    def sheet(self, name=0, columns=None, rows=None):
+        """
+        DataFrame for one sheet. columns limits the columns read (names or
+        letters as for usecols); rows=(start, stop) selects data rows after
+        the header, so rows=(0, 3) reads only the first three.
+        """
+        if isinstance(name, int):
+            name = self.sheet_names[name]
+        key = (name, tuple(columns) if isinstance(columns, list) else columns, tuple(rows) if rows else None)
+        if key not in self._sheets:
+            kwargs = {}
+            if rows:
+                start, stop = rows
+                kwargs["skiprows"] = range(1, start + 1) if start else None
+                kwargs["nrows"] = None if stop is None else stop - start
+            self._sheets[key] = self._excel.parse(name, usecols=columns, **kwargs)
+        return self._sheets[key]
+    
+    def records(self, name=0, columns=None, rows=None):
+        return self.sheet(name, columns, rows).to_dict('records')
+    
+    def close(self):
+        self._excel.close()
+
+
 class DataProcessor:
     """Handle various data processing tasks"""
     
     @staticmethod
-    def process_pdf(pdf_content_base64, page_number=None):
-        """Extract text and tables from PDF"""
+    def binary_source(content, signatures):
+        """
+        Path or raw bytes for binary file input. Bytes that do not start
+        with one of the format's signatures are treated as base64 from
+        older callers and decoded.
+        """
+        if isinstance(content, str) and os.path.exists(content):
+            return content
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            head = bytes(content[:1024]).lstrip()
+            if any(head.startswith(signature) for signature in signatures):
+                return content if isinstance(content, bytes) else bytes(content)
+        return base64.b64decode(content)
+    
+    @staticmethod
+    def process_pdf(pdf_content, page_number=None, tables=False):
+        """
+        Extract text (and optionally tables) from a PDF.
+        
+        Takes raw bytes or a file path. Only the requested page is read when
+        page_number is given; otherwise pages are extracted in parallel and
+        each page's text is cached by content hash. With tables=True every
+        page also gets "tables", a list of DataFrames.
+        """
         try:
-            pdf_bytes = base64.b64decode(pdf_content_base64)
-            pdf_file = io.BytesIO(pdf_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            source = DataProcessor.binary_source(pdf_content, PDF_SIGNATURES)
+            content_hash = _pdf_hash(source)
+            with _pdf_stream(source) as f:
+                page_count = len(PyPDF2.PdfReader(f).pages)
             
             if page_number is not None:
                 # Extract specific page (1-indexed)
-                page = pdf_reader.pages[page_number - 1]
-                text = page.extract_text()
-                return {"page": page_number, "text": text}
-            else:
-                # Extract all pages
-                all_text = []
-                for i, page in enumerate(pdf_reader.pages):
-                    all_text.append({
-                        "page": i + 1,
-                        "text": page.extract_text()
-                    })
-                return all_text
+                if not 1 <= page_number <= page_count:
+                    return {"error": f"Page {page_number} out of range (1-{page_count})"}
+                text = _cached_pdf_pages(source, content_hash, [page_number - 1])[page_number - 1]
+                page = {"page": page_number, "text": text}
+                if tables:
+                    page["tables"] = DataProcessor.tables_from_text(text)
+                return page
+            
+            texts = _cached_pdf_pages(source, content_hash, list(range(page_count)))
+            all_text = []
+            for i in range(page_count):
+                page = {"page": i + 1, "text": texts[i]}
+                if tables:
+                    page["tables"] = DataProcessor.tables_from_text(texts[i])
+                all_text.append(page)
+            return all_text
         except Exception as e:
             return {"error": str(e)}
     
     @staticmethod
-    def process_csv(csv_content, encoding='utf-8'):
-        """Process CSV data"""
+    def csv_source(csv_content):
+        """File-like object or path for CSV input without decoding it to str"""
+        if isinstance(csv_content, (bytes, bytearray, memoryview)):
+            return io.BytesIO(csv_content)
+        if isinstance(csv_content, str) and "\n" not in csv_content and os.path.exists(csv_content):
+            return csv_content
+        if isinstance(csv_content, str):
+            return io.StringIO(csv_content)
+        return csv_content
+    
+    @staticmethod
+    def compact_dtypes(df):
+        """Downcast integer columns and turn repetitive text columns into categoricals"""
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_bool_dtype(series):
+                continue
+            if pd.api.types.is_integer_dtype(series):
+                df[column] = pd.to_numeric(series, downcast="integer")
+            elif series.dtype == object and len(series) and series.nunique(dropna=True) <= CSV_CATEGORY_RATIO * len(series):
+                df[column] = series.astype("category")
+        return df
+    
+    @staticmethod
+    def iter_csv_chunks(csv_content, encoding='utf-8', chunksize=None):
+        """Yield DataFrame chunks, via pyarrow's streaming reader when CSV_ENGINE=pyarrow"""
+        chunksize = chunksize or CSV_CHUNK_ROWS
+        source = DataProcessor.csv_source(csv_content)
+        if CSV_ENGINE == "pyarrow" and not isinstance(source, io.StringIO):
+            try:
+                import pyarrow.csv as pa_csv
+                reader = pa_csv.open_csv(source, read_options=pa_csv.ReadOptions(encoding=encoding))
+                for batch in reader:
+                    yield batch.to_pandas()
+                return
+            except ImportError:
+                pass
+        for chunk in pd.read_csv(source, encoding=encoding, chunksize=chunksize):
+            yield chunk
+    
+    @staticmethod
+    def process_csv(csv_content, encoding='utf-8', materialize=False, chunksize=None):
+        """
+        Stream CSV data in chunks, keeping only running aggregates.
+        
+        Accepts bytes, text, a path or a file object. Numeric columns get
+        count/sum/mean/std/min/max, other columns count/unique/top. The full
+        DataFrame (with compact dtypes) is only built when materialize=True
+        and is returned under "frame".
+        """
         try:
-            if isinstance(csv_content, bytes):
-                csv_content = csv_content.decode(encoding)
+            rows = 0
+            columns = None
+            dtypes = {}
+            preview = []
+            numeric = {}
+            other = {}
+            frames = []
+            
+            for chunk in DataProcessor.iter_csv_chunks(csv_content, encoding, chunksize):
+                chunk = DataProcessor.compact_dtypes(chunk)
+                if columns is None:
+                    columns = chunk.columns.tolist()
+                    preview = chunk.head(3).to_dict('records')
+                rows += len(chunk)
+                for column in chunk.columns:
+                    series = chunk[column]
+                    dtypes[column] = str(series.dtype)
+                    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                        DataProcessor._merge_numeric(numeric.setdefault(column, {}), series.dropna())
+                    else:
+                        DataProcessor._merge_counts(other.setdefault(column, {"count": 0, "values": {}, "overflow": False}), series)
+                if materialize:
+                    frames.append(chunk)
             
-            df = pd.read_csv(io.StringIO(csv_content))
-            return {
-                "columns": df.columns.tolist(),
-                "shape": df.shape,
-                "data": df.to_dict('records'),
-                "summary": df.describe().to_dict()
+            summary = {}
+            for column, stats in numeric.items():
+                n = stats.get("count", 0)
+                summary[column] = {
+                    "count": n,
+                    "sum": stats.get("sum"),
+                    "mean": stats.get("mean"),
+                    "std": (stats["m2"] / (n - 1)) ** 0.5 if n > 1 else None,
+                    "min": stats.get("min"),
+                    "max": stats.get("max"),
+                }
+            for column, stats in other.items():
+                values = stats["values"]
+                top = max(values.items(), key=lambda kv: kv[1]) if values else (None, 0)
+                summary[column] = {
+                    "count": stats["count"],
+                    "unique": f">{CSV_MAX_TRACKED_VALUES}" if stats["overflow"] else len(values),
+                    "top": top[0],
+                    "freq": top[1],
+                }
+            
+            result = {
+                "columns": columns or [],
+                "shape": (rows, len(columns or [])),
+                "dtypes": dtypes,
+                "preview": preview,
+                "summary": summary,
             }
+            if materialize:
+                frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+                result["frame"] = DataProcessor.compact_dtypes(frame)
+            return result
         except Exception as e:
             return {"error": str(e)}
     
     @staticmethod
-    def process_excel(excel_content_base64):
-        """Process Excel files"""
+    def _merge_numeric(stats, series):
+        """Fold one chunk into running count/sum/min/max and Welford mean/M2"""
+        n_b = len(series)
+        if not n_b:
+            return
+        values = series.astype("float64")
+        mean_b = float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+        n_a = stats.get("count", 0)
+        if n_a == 0:
+            stats.update(count=n_b, mean=mean_b, m2=m2_b, sum=series.sum().item(),
+                         min=series.min().item(), max=series.max().item())
+            return
+        n = n_a + n_b
+        delta = mean_b - stats["mean"]
+        stats["mean"] += delta * n_b / n
+        stats["m2"] += m2_b + delta * delta * n_a * n_b / n
+        stats["count"] = n
+        stats["sum"] += series.sum().item()
+        stats["min"] = min(stats["min"], series.min().item())
+        stats["max"] = max(stats["max"], series.max().item())
+    
+    @staticmethod
+    def _merge_counts(stats, series):
+        """Fold one chunk into running value counts, up to CSV_MAX_TRACKED_VALUES"""
+        stats["count"] += int(series.count())
+        if stats["overflow"]:
+            return
+        values = stats["values"]
+        for value, freq in series.value_counts(dropna=True).items():
+            if not freq:
+                continue
+            key = str(value)
+            values[key] = values.get(key, 0) + int(freq)
+        if len(values) > CSV_MAX_TRACKED_VALUES:
+            stats["overflow"] = True
+    
+    @staticmethod
+    def open_workbook(excel_content):
+        """LazyWorkbook over raw bytes or a path (base64 still accepted)"""
+        return LazyWorkbook(DataProcessor.binary_source(excel_content, EXCEL_SIGNATURES))
+    
+    @staticmethod
+    def process_excel(excel_content, sheets=None, columns=None, rows=None, records=True):
+        """
+        Process Excel files given as raw bytes or a path.
+        
+        Only the named sheets (default all) are loaded, optionally limited to
+        columns and a (start, stop) row range; "data" records are built only
+        when records=True.
+        """
         try:
-            excel_bytes = base64.b64decode(excel_content_base64)
-            excel_file = io.BytesIO(excel_bytes)
-            
-            # Read all sheets
-            sheets = pd.read_excel(excel_file, sheet_name=None)
-            
-            result = {}
-            for sheet_name, df in sheets.items():
-                result[sheet_name] = {
-                    "columns": df.columns.tolist(),
-                    "shape": df.shape,
-                    "data": df.to_dict('records')
-                }
-            return result
+            workbook = DataProcessor.open_workbook(excel_content)
+            try:
+                result = {}
+                for sheet_name in sheets or workbook.sheet_names:
+                    df = workbook.sheet(sheet_name, columns=columns, rows=rows)
+                    result[sheet_name] = {
+                        "columns": df.columns.tolist(),
+                        "shape": df.shape,
+                    }
+                    if records:
+                        result[sheet_name]["data"] = df.to_dict('records')
+                return result
+            finally:
+                workbook.close()
         except Exception as e:
             return {"error": str(e)}
     
@@ -82,13 +437,21 @@ class DataProcessor:
             elif operation['type'] == 'mean':
                 column = operation['column']
                 return df[column].mean()
+            elif operation['type'] in ('median', 'min', 'max', 'nunique'):
+                column = operation['column']
+                series = df[column]
+                # compact_dtypes categories are unordered; compare the values instead
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    series = series.astype(series.cat.categories.dtype)
+                return getattr(series, operation['type'])()
             elif operation['type'] == 'count':
                 return len(df)
             elif operation['type'] == 'groupby':
                 group_col = operation['group_column']
                 agg_col = operation['agg_column']
                 agg_func = operation['agg_function']
-                return df.groupby(group_col)[agg_col].agg(agg_func).to_dict()
+                # observed=True: categorical groups emptied by a filter must not appear
+                return df.groupby(group_col, observed=True)[agg_col].agg(agg_func).to_dict()
             elif operation['type'] == 'filter':
                 condition = operation['condition']
                 return len(df.query(condition))
@@ -117,6 +480,24 @@ class DataProcessor:
         
         return tables
     
+    @staticmethod
+    def tables_from_text(text):
+        """DataFrames for the table-like blocks found by extract_tables_from_text"""
+        frames = []
+        for block in DataProcessor.extract_tables_from_text(text or ""):
+            rows = [re.split(r"\t|\s{2,}", line.strip()) for line in block.split("\n") if line.strip()]
+            if len(rows) < 2:
+                continue
+            width = max(len(row) for row in rows)
+            rows = [row + [None] * (width - len(row)) for row in rows]
+            header = rows[0]
+            if len(set(header)) == width and not any(_looks_numeric(cell) for cell in header):
+                df = pd.DataFrame(rows[1:], columns=header)
+            else:
+                df = pd.DataFrame(rows)
+            frames.append(df.apply(pd.to_numeric, errors="ignore"))
+        return frames
+    
     @staticmethod
     def scrape_data_from_html(html_content, selector=None):
         """Extract data from HTML"""
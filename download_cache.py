@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from tracing import count_cache
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Download cache configuration
+# -----------------------------------
+DOWNLOAD_CACHE_ENABLED = os.environ.get("DOWNLOAD_CACHE_ENABLED", "1") == "1"
+DOWNLOAD_CACHE_DIR = os.environ.get("DOWNLOAD_CACHE_DIR", ".cache/downloads")
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get("DOWNLOAD_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+# Entries younger than this (or within their max-age) skip revalidation
+DOWNLOAD_CACHE_FRESH_SECONDS = float(os.environ.get("DOWNLOAD_CACHE_FRESH_SECONDS", 60))
+# Bump when parse_downloaded_file output changes so stale summaries are ignored
+PARSED_CACHE_VERSION = "3"
+
+
+def _max_age(headers):
+    """Seconds of freshness granted by Cache-Control or Expires, if any"""
+    cache_control = headers.get("cache-control", "")
+    for directive in cache_control.split(","):
+        directive = directive.strip().lower()
+        if directive in ("no-cache", "no-store"):
+            return 0
+        if directive.startswith("max-age="):
+            try:
+                return int(directive.split("=", 1)[1])
+            except ValueError:
+                pass
+    expires = headers.get("expires")
+    if expires:
+        try:
+            return max(0, parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def temp_path(path):
+    """
+    A new, empty file beside path to write and then os.replace onto it.
+    Unique per call, so concurrent threads and processes never share one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    # mkstemp creates 0600; cached files must stay readable to the sandbox user
+    os.chmod(tmp_path, 0o644)
+    return tmp_path
+
+
+# -----------------------------------
+# Content-addressed cache
+# -----------------------------------
+class DownloadCache:
+    """
+    On-disk cache of downloaded files, stored once per content hash.
+
+    An SQLite index maps each URL to its content hash and validators
+    (ETag / Last-Modified). Blobs are evicted least-recently-used once the
+    total size passes max_bytes. A second layer keeps parsed summaries (and
+    CSV DataFrames as Parquet) per content hash.
+    """
+
+    def __init__(self, root=DOWNLOAD_CACHE_DIR, max_bytes=DOWNLOAD_CACHE_MAX_BYTES,
+                 fresh_seconds=DOWNLOAD_CACHE_FRESH_SECONDS, enabled=DOWNLOAD_CACHE_ENABLED):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stats = {"fresh_hits": 0, "revalidated": 0, "misses": 0, "parsed_hits": 0, "evictions": 0}
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+            os.makedirs(os.path.join(self.root, "parsed"), exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    content_type TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    max_age REAL,
+                    fetched REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+        return self._conn
+
+    def blob_path(self, content_hash):
+        return os.path.join(self.root, "blobs", content_hash)
+
+    def parsed_path(self, content_hash, suffix="json"):
+        return os.path.join(self.root, "parsed", f"{content_hash}.v{PARSED_CACHE_VERSION}.{suffix}")
+
+    # -- raw file layer --
+
+    def lookup(self, url):
+        """Return the index row for url as a dict, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            cursor = self._db().execute("SELECT * FROM entries WHERE url = ?", (url,))
+            row = cursor.fetchone()
+            names = [c[0] for c in cursor.description]
+        if not row:
+            return None
+        entry = dict(zip(names, row))
+        if not os.path.exists(self.blob_path(entry["hash"])):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        ttl = entry["max_age"] if entry["max_age"] is not None else self.fresh_seconds
+        return time.time() - entry["fetched"] < ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read(self, entry):
+        with open(self.blob_path(entry["hash"]), "rb") as f:
+            return f.read()
+
+    def touch(self, url, refetched, headers=None):
+        """Mark an entry used; on a 304 also refresh its validators"""
+        now = time.time()
+        with self._lock:
+            if refetched:
+                self._stats["revalidated"] += 1
+                count_cache("download", "revalidated")
+                self._db().execute(
+                    "UPDATE entries SET fetched = ?, accessed = ?, max_age = ? WHERE url = ?",
+                    (now, now, _max_age(headers or {}), url),
+                )
+            else:
+                self._stats["fresh_hits"] += 1
+                count_cache("download", "hit")
+                self._db().execute("UPDATE entries SET accessed = ? WHERE url = ?", (now, url))
+            self._db().commit()
+
+    def store(self, url, content, headers):
+        """
+        Save a freshly downloaded body (bytes or a binary file object) and
+        return its content hash
+        """
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            content_hash = hashlib.sha256(content).hexdigest()
+            size = len(content)
+        else:
+            digest = hashlib.sha256()
+            size = 0
+            for block in iter(lambda: content.read(1024 * 1024), b""):
+                digest.update(block)
+                size += len(block)
+            content.seek(0)
+            content_hash = digest.hexdigest()
+        if not self.enabled:
+            return content_hash
+
+        path = self.blob_path(content_hash)
+        with self._lock:
+            self._db()
+        if not os.path.exists(path):
+            tmp_path = temp_path(path)
+            try:
+                with open(tmp_path, "wb") as f:
+                    if isinstance(content, (bytes, bytearray, memoryview)):
+                        f.write(content)
+                    else:
+                        shutil.copyfileobj(content, f, 1024 * 1024)
+                        content.seek(0)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        now = time.time()
+        with self._lock:
+            self._stats["misses"] += 1
+            count_cache("download", "miss")
+            self._db().execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, content_hash, size, headers.get("content-type", "unknown"),
+                 headers.get("etag"), headers.get("last-modified"), _max_age(headers), now, now),
+            )
+            self._db().commit()
+        self._evict()
+        return content_hash
+
+    def has_blob(self, content_hash):
+        return self.enabled and os.path.exists(self.blob_path(content_hash))
+
+    def _evict(self):
+        """Drop least-recently-used blobs until the cache fits in max_bytes"""
+        with self._lock:
+            db = self._db()
+            rows = db.execute(
+                "SELECT hash, SUM(size) / COUNT(*), MAX(accessed) FROM entries GROUP BY hash ORDER BY MAX(accessed)"
+            ).fetchall()
+            total = sum(size for _, size, _ in rows)
+            for content_hash, size, _ in rows:
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM entries WHERE hash = ?", (content_hash,))
+                for path in (self.blob_path(content_hash), self.parsed_path(content_hash),
+                             self.parsed_path(content_hash, "parquet")):
+                    if os.path.exists(path):
+                        os.remove(path)
+                total -= size
+                self._stats["evictions"] += 1
+            db.commit()
+
+    # -- parsed layer --
+
+    def load_parsed(self, content_hash):
+        if not self.enabled:
+            return None
+        path = self.parsed_path(content_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                parsed = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._stats["parsed_hits"] += 1
+        count_cache("parsed", "hit")
+        return parsed
+
+    def save_parsed(self, content_hash, file_info):
+        if not self.enabled or "parse_error" in file_info or "error" in file_info:
+            return
+        path = self.parsed_path(content_hash)
+        tmp_path = None
+        try:
+            tmp_path = temp_path(path)
+            with open(tmp_path, "w") as f:
+                json.dump(file_info, f, default=str)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not cache parsed file {content_hash}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def frame_path(self, content_hash):
+        """Where a parsed DataFrame for this content is (or should be) stored"""
+        return self.parsed_path(content_hash, "parquet") if self.enabled else None
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, **self._stats}
+
+
+DOWNLOAD_CACHE = DownloadCache()
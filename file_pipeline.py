@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import time
+import tempfile
+import logging
+import multiprocessing
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+import http_client
+from data_processor import DataProcessor
+from download_cache import DOWNLOAD_CACHE, temp_path
+from retry_policy import DOWNLOAD_RETRY
+from tracing import span, bind
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# File pipeline configuration
+# -----------------------------------
+FILE_MAX_COUNT = int(os.environ.get("FILE_MAX_COUNT", 10))  # files per quiz
+FILE_DEADLINE = float(os.environ.get("FILE_DEADLINE", 45))  # seconds for all downloads + parsing
+FILE_DOWNLOAD_WORKERS = int(os.environ.get("FILE_DOWNLOAD_WORKERS", 8))
+FILE_PARSE_WORKERS = int(os.environ.get("FILE_PARSE_WORKERS", 2))
+FILE_SPOOL_BYTES = int(os.environ.get("FILE_SPOOL_BYTES", 8 * 1024 * 1024))  # larger downloads spill to disk
+
+FILE_URL_PATTERN = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+\.(?:csv|json|pdf|txt|xlsx|xls)', re.IGNORECASE)
+
+# Formats whose parsing is CPU-heavy enough to leave the request thread.
+# PDFs stay out: DataProcessor.process_pdf spreads large ones over its own page pool.
+PROCESS_POOL_TYPES = {"csv", "xlsx", "xls"}
+
+_download_pool = ThreadPoolExecutor(max_workers=FILE_DOWNLOAD_WORKERS, thread_name_prefix="file-download")
+_parse_pool = None
+
+
+def get_parse_pool():
+    """
+    Process pool for parsing, created lazily so gunicorn workers own theirs.
+
+    Uses spawn: forking a process that runs browser threads is unsafe.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=FILE_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_pool
+
+
+def find_file_urls(instructions):
+    """
+    Return the downloadable data file URLs mentioned in the instructions
+    """
+    return list(dict.fromkeys(FILE_URL_PATTERN.findall(instructions)))
+
+
+def file_extension(url):
+    return os.path.splitext(urlparse(url).path)[1].lstrip(".").lower()
+
+
+# -----------------------------------
+# Parse one downloaded file
+# -----------------------------------
+def read_source(source, limit=-1):
+    """Bytes of a file given as bytes or a path, up to limit bytes"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(limit)
+    return source if limit < 0 else source[:limit]
+
+
+def parse_downloaded_file(url, content, content_type):
+    """
+    Summarize a downloaded file for the prompt based on its extension.
+
+    content is the raw bytes or the path of a local copy (the cache blob),
+    which lets the process pool read the file instead of unpickling it.
+    """
+    file_info = {
+        "url": url,
+        "content_type": content_type,
+        "size": os.path.getsize(content) if isinstance(content, str) else len(content)
+    }
+    extension = file_extension(url)
+
+    # Try to parse based on file type
+    if extension == 'csv':
+        # Streamed in chunks; the full frame is only built by compute_engine.load_frame
+        parsed = DataProcessor.process_csv(content)
+        if "error" in parsed:
+            file_info["parse_error"] = parsed["error"]
+            file_info["preview"] = "Could not parse CSV"
+        else:
+            file_info["preview"] = parsed["preview"]
+            file_info["columns"] = parsed["columns"]
+            file_info["shape"] = parsed["shape"]
+            file_info["dtypes"] = parsed["dtypes"]
+            file_info["summary"] = parsed["summary"]
+
+    elif extension == 'json':
+        try:
+            data = json.loads(read_source(content))
+            if isinstance(data, list):
+                file_info["preview"] = data[:3] if len(data) > 3 else data
+            elif isinstance(data, dict):
+                file_info["preview"] = {k: data[k] for k in list(data.keys())[:3]}
+            else:
+                file_info["preview"] = str(data)[:500]
+            file_info["type"] = type(data).__name__
+        except:
+            file_info["preview"] = "Invalid JSON"
+
+    elif extension == 'txt':
+        try:
+            text_content = bytes(read_source(content, 4000)).decode('utf-8', errors='replace')[:1000]  # First 1000 chars
+            file_info["preview"] = text_content
+        except:
+            file_info["preview"] = "Could not read text"
+
+    elif extension == 'pdf':
+        pages = DataProcessor.process_pdf(content, tables=True)
+        if isinstance(pages, dict) and "error" in pages:
+            file_info["parse_error"] = pages["error"]
+        else:
+            file_info["pages"] = len(pages)
+            file_info["preview"] = [{"page": p["page"], "text": (p["text"] or "")[:1000]} for p in pages[:3]]
+            tables = [(p["page"], t) for p in pages for t in p["tables"]]
+            if tables:
+                file_info["tables"] = [
+                    {"page": page, "columns": [str(c) for c in t.columns], "shape": t.shape,
+                     "rows": t.head(3).to_dict(orient="records")}
+                    for page, t in tables[:5]
+                ]
+
+    elif extension in ('xlsx', 'xls'):
+        # Only sheet metadata and the first rows of each sheet are read
+        try:
+            workbook = DataProcessor.open_workbook(content)
+            try:
+                dimensions = workbook.dimensions()
+                file_info["preview"] = {}
+                for name in workbook.sheet_names:
+                    head = workbook.sheet(name, rows=(0, 3))
+                    total_rows, total_columns = dimensions[name]
+                    file_info["preview"][name] = {
+                        "columns": head.columns.tolist(),
+                        "shape": (max(total_rows - 1, 0) if total_rows else None, total_columns),
+                        "rows": head.to_dict(orient='records'),
+                    }
+            finally:
+                workbook.close()
+        except Exception as e:
+            file_info["parse_error"] = str(e)
+
+    return file_info
+
+
+def save_frame(df, frame_path):
+    """Best-effort Parquet copy of a parsed DataFrame for later cache hits"""
+    tmp_path = None
+    try:
+        tmp_path = temp_path(frame_path)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, frame_path)
+    except Exception as e:
+        logger.warning(f"Could not cache DataFrame at {frame_path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# -----------------------------------
+# Download with a hard deadline
+# -----------------------------------
+def download_file(url, end_time, headers=None):
+    """
+    Stream a file into a spooled temp file, giving up once end_time passes.
+
+    Returns (body, content_type, response headers, status code); body is a
+    file object at position 0 (in memory up to FILE_SPOOL_BYTES, on disk
+    beyond), or None on a 304 Not Modified.
+    """
+    remaining = end_time - time.time()
+    if remaining <= 0:
+        raise TimeoutError("File deadline passed before download started")
+
+    logger.info(f"Downloading file: {url}")
+    response = DOWNLOAD_RETRY.call(
+        url, lambda timeout: http_client.get(url, timeout=timeout, stream=True, headers=headers), end_time
+    )
+    try:
+        if response.status_code == 304:
+            return None, None, response.headers, 304
+        response.raise_for_status()
+        body = tempfile.SpooledTemporaryFile(max_size=FILE_SPOOL_BYTES)
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if time.time() > end_time:
+                    raise TimeoutError(f"File deadline passed while downloading {url}")
+                body.write(chunk)
+        except BaseException:
+            body.close()
+            raise
+        body.seek(0)
+        return body, response.headers.get('content-type', 'unknown'), response.headers, response.status_code
+    finally:
+        response.close()
+
+
+def run_parser(url, content, content_type, end_time):
+    """Parse inline, or on the process pool for CPU-heavy formats"""
+    if file_extension(url) in PROCESS_POOL_TYPES:
+        future = get_parse_pool().submit(parse_downloaded_file, url, content, content_type)
+        return future.result(timeout=max(0, end_time - time.time()))
+    return parse_downloaded_file(url, content, content_type)
+
+
+def parse_with_cache(url, content_hash, content, content_type, end_time):
+    """
+    Reuse the parsed summary for this content if cached, else parse and
+    cache it. content may be None when it is in the blob store, in which
+    case the parser reads the blob file directly.
+    """
+    parsed = DOWNLOAD_CACHE.load_parsed(content_hash)
+    if parsed:
+        parsed["url"] = url
+        parsed["content_hash"] = content_hash
+        return parsed
+    if content is None:
+        content = DOWNLOAD_CACHE.blob_path(content_hash)
+    with span("file.parse", type=file_extension(url)):
+        file_info = run_parser(url, content, content_type, end_time)
+    DOWNLOAD_CACHE.save_parsed(content_hash, file_info)
+    # Lets the local compute engine find the full data again
+    file_info["content_hash"] = content_hash
+    return file_info
+
+
+def download_and_parse(url, end_time):
+    with span("file", url=url) as current:
+        try:
+            entry = DOWNLOAD_CACHE.lookup(url)
+            if entry and DOWNLOAD_CACHE.is_fresh(entry):
+                # Fresh cache hit: no network at all
+                DOWNLOAD_CACHE.touch(url, refetched=False)
+                return parse_with_cache(url, entry["hash"], None, entry["content_type"], end_time)
+
+            body, content_type, headers, status = download_file(
+                url, end_time, DOWNLOAD_CACHE.conditional_headers(entry)
+            )
+            if status == 304 and entry:
+                DOWNLOAD_CACHE.touch(url, refetched=True, headers=headers)
+                return parse_with_cache(url, entry["hash"], None, entry["content_type"], end_time)
+            if body is None:
+                raise RuntimeError("Got 304 Not Modified without a cached copy")
+
+            with body:
+                content_hash = DOWNLOAD_CACHE.store(url, body, headers)
+                # Parse from the blob when it was stored, else from memory
+                content = None if DOWNLOAD_CACHE.has_blob(content_hash) else body.read()
+            return parse_with_cache(url, content_hash, content, content_type, end_time)
+        except Exception as e:
+            current.fail(e)
+            logger.error(f"Error processing file {url}: {e}")
+            return {"url": url, "error": str(e) or type(e).__name__}
+
+
+def process_files(file_urls, deadline=FILE_DEADLINE):
+    """
+    Download and parse files concurrently within one overall deadline.
+
+    Files that have not finished by the deadline are reported as timed out
+    instead of holding up the LLM call.
+    """
+    file_urls = file_urls[:FILE_MAX_COUNT]
+    if not file_urls:
+        return []
+
+    end_time = time.time() + deadline
+    with span("files", count=len(file_urls)):
+        # bind() carries the job's trace into the pool threads
+        futures = [_download_pool.submit(bind(download_and_parse), url, end_time) for url in file_urls]
+        wait(futures, timeout=deadline)
+
+    processed_files = []
+    for url, future in zip(file_urls, futures):
+        if future.done():
+            processed_files.append(future.result())
+        else:
+            future.cancel()
+            logger.warning(f"Dropping {url}, not ready within {deadline}s")
+            processed_files.append({"url": url, "error": f"Timed out after {deadline}s"})
+    return processed_files
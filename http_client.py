@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from tracing import observe_http
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Shared HTTP configuration
+# -----------------------------------
+HTTP_POOL_HOSTS = int(os.environ.get("HTTP_POOL_HOSTS", 20))  # hosts with a cached pool
+HTTP_POOL_PER_HOST = int(os.environ.get("HTTP_POOL_PER_HOST", 10))  # connections per host
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "0") == "1"  # async client only, needs h2
+
+
+# -----------------------------------
+# Per-host metrics
+# -----------------------------------
+class HttpMetrics:
+    """
+    Per-host request counts, latency and connection reuse, plus hooks that
+    receive every request record
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """hook(record) is called with a dict for every finished request"""
+        self._hooks.append(hook)
+
+    def record(self, method, url, elapsed, status=None, new_connection=None, error=None):
+        host = urlparse(url).hostname or "unknown"
+        with self._lock:
+            h = self._hosts.setdefault(host, {
+                "requests": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "tracked": 0, "new_connections": 0,
+            })
+            h["requests"] += 1
+            h["errors"] += 1 if error else 0
+            h["total_ms"] += elapsed * 1000
+            h["max_ms"] = max(h["max_ms"], elapsed * 1000)
+            if new_connection is not None:
+                h["tracked"] += 1
+                h["new_connections"] += 1 if new_connection else 0
+
+        record = {
+            "method": method, "host": host, "url": url, "elapsed": elapsed,
+            "status": status, "new_connection": new_connection, "error": error,
+        }
+        for hook in self._hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                logger.warning(f"HTTP metrics hook failed: {e}")
+
+    def summary(self):
+        # The sync session's urllib3 pools count connections they opened
+        pool_counts = {}
+        for adapter in _session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    counts = pool_counts.setdefault(pool.host, [0, 0])
+                    counts[0] += pool.num_requests
+                    counts[1] += pool.num_connections
+
+        with self._lock:
+            result = {}
+            for host, h in self._hosts.items():
+                tracked, new_conns = h["tracked"], h["new_connections"]
+                sync_requests, sync_conns = pool_counts.get(host, [0, 0])
+                tracked += sync_requests
+                new_conns += sync_conns
+                result[host] = {
+                    "requests": h["requests"],
+                    "errors": h["errors"],
+                    "avg_ms": round(h["total_ms"] / h["requests"], 1),
+                    "max_ms": round(h["max_ms"], 1),
+                    "reuse_rate": round(1 - new_conns / tracked, 3) if tracked else None,
+                }
+            return result
+
+
+HTTP_METRICS = HttpMetrics()
+HTTP_METRICS.add_hook(observe_http)
+
+
+# -----------------------------------
+# Sync client (requests, used by the Flask app)
+# -----------------------------------
+_session = requests.Session()
+for _prefix in ("http://", "https://"):
+    _session.mount(_prefix, HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_PER_HOST))
+
+def request(method, url, **kwargs):
+    """
+    Send a request over the shared keep-alive session
+    """
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    start = time.time()
+    try:
+        response = _session.request(method, url, **kwargs)
+    except Exception as e:
+        HTTP_METRICS.record(method, url, time.time() - start, error=str(e))
+        raise
+    HTTP_METRICS.record(method, url, time.time() - start, status=response.status_code)
+    return response
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+# -----------------------------------
+# Async client (httpx, used by the async pipeline)
+# -----------------------------------
+_async_client = None
+_host_limits = {}
+
+def get_async_client():
+    """
+    Shared async client, created inside the running event loop
+    """
+    global _async_client
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_HOSTS * HTTP_POOL_PER_HOST,
+                max_keepalive_connections=HTTP_POOL_HOSTS * HTTP_POOL_PER_HOST,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+    return _async_client
+
+async def arequest(method, url, **kwargs):
+    """
+    Async request with a per-host connection limit
+    """
+    host = urlparse(url).hostname
+    limit = _host_limits.setdefault(host, asyncio.Semaphore(HTTP_POOL_PER_HOST))
+
+    # httpcore reports TCP connects through the trace extension
+    new_connection = False
+    async def trace(event_name, info):
+        nonlocal new_connection
+        if event_name.startswith("connection.connect_tcp"):
+            new_connection = True
+
+    async with limit:
+        start = time.time()
+        try:
+            response = await get_async_client().request(method, url, extensions={"trace": trace}, **kwargs)
+        except Exception as e:
+            HTTP_METRICS.record(method, url, time.time() - start, new_connection=new_connection, error=str(e))
+            raise
+    HTTP_METRICS.record(method, url, time.time() - start, status=response.status_code, new_connection=new_connection)
+    return response
+
+@asynccontextmanager
+async def astream(method, url, **kwargs):
+    """
+    Async streaming request; the body is read inside the with block and
+    leaving the block early abandons the rest of it
+    """
+    host = urlparse(url).hostname
+    limit = _host_limits.setdefault(host, asyncio.Semaphore(HTTP_POOL_PER_HOST))
+
+    async with limit:
+        start = time.time()
+        try:
+            async with get_async_client().stream(method, url, **kwargs) as response:
+                yield response
+        except Exception as e:
+            HTTP_METRICS.record(method, url, time.time() - start, error=str(e))
+            raise
+    HTTP_METRICS.record(method, url, time.time() - start, status=response.status_code)
+
+async def aget(url, **kwargs):
+    return await arequest("GET", url, **kwargs)
+
+async def apost(url, **kwargs):
+    return await arequest("POST", url, **kwargs)
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
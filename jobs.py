@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import asyncio
+import threading
+import logging
+from tracing import TRACE_JOBS, start_trace, span
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Job queue configuration
+# -----------------------------------
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", 20))
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+def process_token(pid=None):
+    """
+    pid plus the process start time, so a recycled pid (e.g. after a
+    container restart) does not look like the process that owned a job
+    """
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Field 22 (starttime) comes after the parenthesised command name
+            started = f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        started = "?"
+    return f"{pid}:{started}"
+
+
+# -----------------------------------
+# SQLite-backed job records
+# -----------------------------------
+class JobStore:
+    """
+    Persist job state so any worker process can answer /jobs/<id>
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                stages TEXT,
+                result TEXT,
+                status_code INTEGER,
+                owner TEXT
+            )"""
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.commit()
+        self.owner = process_token()
+        self.fail_orphans()
+
+    def fail_orphans(self):
+        """
+        Mark queued and running jobs whose owning process is gone as failed;
+        their in-memory queue died with it, so nothing would ever finish them.
+        Jobs of live sibling workers sharing the database are left alone.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        orphans = [
+            job_id for job_id, owner in rows
+            if not owner or process_token(int(owner.split(":")[0])) != owner
+        ]
+        if not orphans:
+            return 0
+        result = json.dumps({"error": "Job interrupted by a server restart"})
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'failed', finished = ?, result = ?, status_code = 500 WHERE id = ?",
+                [(time.time(), result, job_id) for job_id in orphans],
+            )
+            self._conn.commit()
+        logger.warning(f"Marked {len(orphans)} interrupted jobs as failed")
+        return len(orphans)
+
+    def create(self, url, created):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, url, status, created, owner) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, url, created, self.owner),
+            )
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id, **fields):
+        for key in ("stages", "result"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key], default=str)
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            names = [c[0] for c in cursor.description]
+        if not row:
+            return None
+        job = dict(zip(names, row))
+        for key in ("stages", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+
+def record_job_result(store, job_id, url, created, runner_result, trace=None):
+    """Record the outcome of a finished runner call, with its trace if enabled"""
+    result, status_code, stages = runner_result
+    if trace is not None and TRACE_JOBS:
+        stages["trace"] = trace.to_dict()
+    store.update(
+        job_id,
+        status="completed" if status_code == 200 else "failed",
+        finished=time.time(),
+        stages=stages,
+        result=result,
+        status_code=status_code,
+    )
+    logger.info(f"Job {job_id} for {url} finished with {status_code} in {time.time() - created:.2f}s")
+
+
+# -----------------------------------
+# Bounded thread worker pool
+# -----------------------------------
+class JobQueue:
+    """
+    Bounded queue of quiz jobs drained by a fixed pool of worker threads.
+
+    runner(url, start_time, stages) must return (result dict, status code)
+    and fill stages with per-stage timings.
+    """
+
+    def __init__(self, store, runner, workers=JOB_WORKERS, depth=JOB_QUEUE_DEPTH):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=depth)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, url, created):
+        """Enqueue a quiz URL and return its job id, or raise QueueFull"""
+        self._start()
+        job_id = self.store.create(url, created)
+        try:
+            self._queue.put_nowait((job_id, url, created))
+        except queue.Full:
+            self.store.update(job_id, status="rejected", finished=time.time())
+            raise QueueFull(f"Job queue is full ({self._queue.maxsize} jobs)")
+        return job_id
+
+    def _work(self):
+        while True:
+            job_id, url, created = self._queue.get()
+            with self._lock:
+                self._running += 1
+            stages = {}
+            trace = None
+            try:
+                self.store.update(job_id, status="running", started=time.time())
+                with start_trace() as trace, span("job"):
+                    result, status_code = self.runner(url, created, stages)
+                record_job_result(self.store, job_id, url, created, (result, status_code, stages), trace)
+            except Exception as e:
+                logger.error(f"Job {job_id} crashed: {e}")
+                record_job_result(self.store, job_id, url, created, ({"error": str(e)}, 500, stages), trace)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self._queue.qsize(),
+            "depth": self._queue.maxsize,
+        }
+
+
+# -----------------------------------
+# Bounded asyncio worker pool
+# -----------------------------------
+class AsyncJobQueue:
+    """
+    Async version of JobQueue; runner is a coroutine function. SQLite calls
+    run in threads so a slow query never blocks the event loop.
+    """
+
+    def __init__(self, store, runner, workers=JOB_WORKERS, depth=JOB_QUEUE_DEPTH):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.depth = depth
+        self._queue = None
+        self._tasks = []
+        self._running = 0
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.depth)
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def submit(self, url, created):
+        self._start()
+        job_id = await asyncio.to_thread(self.store.create, url, created)
+        try:
+            self._queue.put_nowait((job_id, url, created))
+        except asyncio.QueueFull:
+            await asyncio.to_thread(self.store.update, job_id, status="rejected", finished=time.time())
+            raise QueueFull(f"Job queue is full ({self.depth} jobs)")
+        return job_id
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _work(self):
+        while True:
+            job_id, url, created = await self._queue.get()
+            self._running += 1
+            stages = {}
+            trace = None
+            try:
+                await asyncio.to_thread(self.store.update, job_id, status="running", started=time.time())
+                with start_trace() as trace, span("job"):
+                    result, status_code = await self.runner(url, created, stages)
+                await asyncio.to_thread(
+                    record_job_result, self.store, job_id, url, created, (result, status_code, stages), trace
+                )
+            except Exception as e:
+                logger.error(f"Job {job_id} crashed: {e}")
+                await asyncio.to_thread(
+                    record_job_result, self.store, job_id, url, created, ({"error": str(e)}, 500, stages), trace
+                )
+            finally:
+                self._running -= 1
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "depth": self.depth,
+        }
@@ -0,0 +1,138 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from tracing import count_cache
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# LLM cache configuration
+# -----------------------------------
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.db")
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 2000))
+# Skip the cache when re-solving after the grader rejected an answer
+LLM_CACHE_BYPASS_ON_RETRY = os.environ.get("LLM_CACHE_BYPASS_ON_RETRY", "1") == "1"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so formatting-only differences share a cache entry"""
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def cache_key(payload):
+    """Hash of model, temperature and normalized prompt messages"""
+    messages = [
+        {"role": m.get("role"), "content": normalize_prompt(m.get("content", ""))}
+        for m in payload.get("messages", [])
+    ]
+    material = json.dumps({
+        "model": payload.get("model"),
+        "temperature": payload.get("temperature"),
+        "messages": messages,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+# -----------------------------------
+# Persistent response cache
+# -----------------------------------
+class LLMCache:
+    """
+    SQLite-backed cache of chat completion replies with TTL and
+    least-recently-used eviction
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 enabled=LLM_CACHE_ENABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "saved_seconds": 0.0}
+
+    def _db(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    latency REAL NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, payload):
+        """Return the cached reply for payload, or None"""
+        if not self.enabled:
+            return None
+        key = cache_key(payload)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT response, latency, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if not row or now - row[2] > self.ttl:
+                self._stats["misses"] += 1
+                count_cache("llm", "miss")
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            db.commit()
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += row[1]
+        count_cache("llm", "hit")
+        logger.info(f"LLM cache hit, saved ~{row[1]:.1f}s")
+        return row[0]
+
+    def put(self, payload, response, latency):
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (cache_key(payload), response, latency, now, now),
+            )
+            # Expired rows first, then the least recently used beyond the cap
+            expired = db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            overflow = db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._stats["evictions"] += expired + overflow
+            db.commit()
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": self.enabled,
+                **self._stats,
+                "saved_seconds": round(self._stats["saved_seconds"], 2),
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+LLM_CACHE = LLMCache()
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import threading
+import logging
+from collections import deque
+from prompt_budget import estimate_tokens
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Model routing configuration
+# -----------------------------------
+MODEL_ROUTING_ENABLED = os.environ.get("MODEL_ROUTING_ENABLED", "1") == "1"
+# Weakest first; the last tier is the model every call used before routing
+MODEL_TIERS = [m.strip() for m in os.environ.get("MODEL_TIERS", "gpt-4o-mini,gpt-4").split(",") if m.strip()]
+MODEL_LARGE_PROMPT_TOKENS = int(os.environ.get("MODEL_LARGE_PROMPT_TOKENS", 4500))  # prompts this big start a tier up
+MODEL_ESCALATE_BELOW = float(os.environ.get("MODEL_ESCALATE_BELOW", 0.5))  # self-reported confidence that escalates
+MODEL_ESCALATION_MIN_SECONDS = float(os.environ.get("MODEL_ESCALATION_MIN_SECONDS", 10))  # time left needed to escalate
+MODEL_MAX_TOKENS = 2000  # reply limit before routing, and the cap for escalated calls
+
+# Route name -> starting tier and reply token limit. Question types route
+# the answer prompt; "plan" and "code" route the local-compute and
+# generated-code prompts. MODEL_ROUTES (JSON) overrides entries.
+MODEL_ROUTES = {
+    "calculation": {"tier": 0, "max_tokens": 600},
+    "file_processing": {"tier": 0, "max_tokens": 1000},
+    "information_extraction": {"tier": 0, "max_tokens": 600},
+    "visualization": {"tier": 1, "max_tokens": MODEL_MAX_TOKENS},
+    "unknown": {"tier": 1, "max_tokens": MODEL_MAX_TOKENS},
+    "plan": {"tier": 0, "max_tokens": 600},
+    "code": {"tier": 1, "max_tokens": 1500},
+    "default": {"tier": len(MODEL_TIERS) - 1, "max_tokens": MODEL_MAX_TOKENS},
+}
+MODEL_ROUTES.update(json.loads(os.environ.get("MODEL_ROUTES", "{}")))
+
+# USD per million prompt / completion tokens, for the cost estimate
+MODEL_PRICES = {
+    "gpt-4o-mini": [0.15, 0.6],
+    "gpt-4o": [2.5, 10.0],
+    "gpt-4": [30.0, 60.0],
+}
+MODEL_PRICES.update(json.loads(os.environ.get("MODEL_PRICES", "{}")))
+
+METRICS.describe("quiz_llm_route_seconds", "LLM call duration by route and model")
+METRICS.describe("quiz_llm_cost_usd_total", "Estimated LLM spend by route and model")
+METRICS.describe("quiz_llm_escalations_total", "Calls moved to a stronger model, by reason")
+METRICS.describe("quiz_llm_route_outcomes_total", "Grader verdicts on answers by route and model")
+
+
+def _make_route(name, tier, max_tokens, reason):
+    tier = max(0, min(tier, len(MODEL_TIERS) - 1))
+    model = MODEL_TIERS[tier]
+    return {
+        "name": name,
+        "key": f"{name}:{model}",
+        "model": model,
+        "tier": tier,
+        "max_tokens": max_tokens,
+        "reason": reason,
+    }
+
+
+def choose_route(name, prompt, previous_attempts=None):
+    """
+    Model and reply limit for a prompt: the route's starting tier, one
+    tier up for a large prompt, and one more per answer the grader rejected
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return _make_route("default", len(MODEL_TIERS) - 1, MODEL_MAX_TOKENS, "routing_disabled")
+    config = MODEL_ROUTES.get(name) or MODEL_ROUTES["default"]
+    tier = config["tier"]
+    reason = "table"
+    if estimate_tokens(prompt) >= MODEL_LARGE_PROMPT_TOKENS:
+        tier += 1
+        reason = "large_prompt"
+    if previous_attempts:
+        # Counted once per retry by the chain scheduler, not per model call
+        tier += len(previous_attempts)
+        reason = "grader_rejection"
+    return _make_route(name, tier, config["max_tokens"], reason)
+
+
+def escalation_reason(reply, result):
+    """
+    Why a reply should be retried on a stronger model, or None. A missing
+    reply is an API failure, which the retry policy already handles.
+    """
+    if not reply:
+        return None
+    if result is None:
+        return "parse_failure"
+    if not isinstance(result, dict):
+        return None
+    if str(result.get("reasoning") or "").startswith("Fallback"):
+        return "parse_failure"
+    try:
+        if float(result.get("confidence")) < MODEL_ESCALATE_BELOW:
+            return "low_confidence"
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def escalate(route, reason, deadline=None):
+    """
+    The next tier up for route with a doubled reply limit, or None when it
+    is already the strongest model or too little time is left
+    """
+    if not MODEL_ROUTING_ENABLED or route["tier"] >= len(MODEL_TIERS) - 1:
+        return None
+    if deadline and deadline - time.time() < MODEL_ESCALATION_MIN_SECONDS:
+        logger.info(f"No time left to escalate route {route['key']} ({reason})")
+        return None
+    stronger = _make_route(route["name"], route["tier"] + 1, min(route["max_tokens"] * 2, MODEL_MAX_TOKENS), reason)
+    ROUTER_STATS.record_escalation(route["name"], reason)
+    logger.info(f"Escalating route {route['key']} to {stronger['model']} ({reason})")
+    return stronger
+
+
+def tag_route(solution, route):
+    """Remember which route produced a solution so the grader's verdict is credited to it"""
+    if isinstance(solution, dict):
+        solution["route"] = route["key"]
+    return solution
+
+
+# -----------------------------------
+# Per-route statistics
+# -----------------------------------
+class RouterStats:
+    """Latency, token cost and grader accuracy per route and model"""
+
+    def __init__(self, max_samples=200):
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self._routes = {}
+        self._escalations = {}
+
+    def _route(self, key):
+        r = self._routes.get(key)
+        if r is None:
+            r = self._routes[key] = {
+                "calls": 0, "cache_hits": 0, "failures": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+                "correct": 0, "incorrect": 0, "latencies": deque(maxlen=self._max_samples),
+            }
+        return r
+
+    def record_call(self, route, elapsed, prompt, content, usage=None):
+        """One LLM call; token counts are estimated when the API does not report them"""
+        if not content:
+            # Failed calls are retried by the policy and not billed here
+            with self._lock:
+                r = self._route(route["key"])
+                r["failures"] += 1
+                r["latencies"].append(elapsed)
+            return
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if not isinstance(prompt_tokens, int):
+            prompt_tokens = estimate_tokens(prompt)
+        if not isinstance(completion_tokens, int):
+            completion_tokens = estimate_tokens(content)
+        prices = MODEL_PRICES.get(route["model"], [0.0, 0.0])
+        cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+        with self._lock:
+            r = self._route(route["key"])
+            r["calls"] += 1
+            r["prompt_tokens"] += prompt_tokens
+            r["completion_tokens"] += completion_tokens
+            r["cost_usd"] += cost
+            r["latencies"].append(elapsed)
+        METRICS.observe("quiz_llm_route_seconds", elapsed, route=route["name"], model=route["model"])
+        METRICS.inc("quiz_llm_cost_usd_total", cost, route=route["name"], model=route["model"])
+
+    def record_cache_hit(self, route):
+        with self._lock:
+            self._route(route["key"])["cache_hits"] += 1
+
+    def record_escalation(self, name, reason):
+        with self._lock:
+            key = f"{name}:{reason}"
+            self._escalations[key] = self._escalations.get(key, 0) + 1
+        METRICS.inc("quiz_llm_escalations_total", route=name, reason=reason)
+
+    def record_outcome(self, key, correct):
+        with self._lock:
+            self._route(key)["correct" if correct else "incorrect"] += 1
+        name, _, model = key.partition(":")
+        METRICS.inc("quiz_llm_route_outcomes_total", route=name, model=model, result="correct" if correct else "incorrect")
+
+    def summary(self):
+        with self._lock:
+            routes = {k: dict(v, latencies=sorted(v["latencies"])) for k, v in self._routes.items()}
+            escalations = dict(self._escalations)
+
+        out = {}
+        for key, r in routes.items():
+            latencies = r.pop("latencies")
+            graded = r["correct"] + r["incorrect"]
+            out[key] = {
+                **r,
+                "cost_usd": round(r["cost_usd"], 6),
+                "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+                "accuracy": round(r["correct"] / graded, 3) if graded else None,
+            }
+        return {"enabled": MODEL_ROUTING_ENABLED, "tiers": MODEL_TIERS, "routes": out, "escalations": escalations}
+
+
+ROUTER_STATS = RouterStats()
+
+
+def record_route_outcome(solution, submission_result):
+    """Credit the grader's verdict to the route that produced the submitted answer"""
+    key = solution.get("route") if isinstance(solution, dict) else None
+    correct = submission_result.get("correct") if isinstance(submission_result, dict) else None
+    if key and isinstance(correct, bool):
+        ROUTER_STATS.record_outcome(key, correct)
@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Readiness configuration
+# -----------------------------------
+# CSS selector and/or text that must be present before a page counts as ready
+READY_SELECTOR = os.environ.get("READY_SELECTOR") or None
+READY_TEXT = os.environ.get("READY_TEXT") or None
+# How long the DOM must stay unchanged, and the hard ceiling for the whole wait
+READY_QUIET_MS = int(os.environ.get("READY_QUIET_MS", 500))
+READY_TIMEOUT_MS = int(os.environ.get("READY_TIMEOUT_MS", 10000))
+READY_POLL_MS = int(os.environ.get("READY_POLL_MS", 100))
+
+# Installed before any page script runs so early mutations are seen too
+MUTATION_OBSERVER_SCRIPT = """
+(() => {
+    window.__quizReady = { last: performance.now(), mutations: 0 };
+    new MutationObserver(() => {
+        window.__quizReady.last = performance.now();
+        window.__quizReady.mutations += 1;
+    }).observe(document, { childList: true, subtree: true, characterData: true, attributes: true });
+})();
+"""
+
+READY_PREDICATE = """
+({ quietMs, selector, text }) => {
+    const state = window.__quizReady;
+    if (!state || !document.body) return false;
+    const bodyText = document.body.innerText || "";
+    if (!bodyText.trim()) return false;
+    if (selector && !document.querySelector(selector)) return false;
+    if (text && !bodyText.toLowerCase().includes(text.toLowerCase())) return false;
+    return performance.now() - state.last >= quietMs;
+}
+"""
+
+
+# -----------------------------------
+# Per-page readiness timings
+# -----------------------------------
+class ReadinessRecorder:
+    """Keep recent render-readiness samples for threshold tuning"""
+
+    def __init__(self, max_samples=500):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, url, elapsed_ms, ready):
+        with self._lock:
+            self._samples.append({"url": url, "elapsed_ms": elapsed_ms, "ready": ready})
+
+    def summary(self):
+        with self._lock:
+            samples = list(self._samples)
+
+        if not samples:
+            return {"count": 0}
+
+        timings = sorted(s["elapsed_ms"] for s in samples)
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+        return {
+            "count": len(samples),
+            "timeouts": sum(1 for s in samples if not s["ready"]),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": timings[-1],
+            "recent": samples[-5:],
+        }
+
+
+READINESS_RECORDER = ReadinessRecorder()
+
+
+# -----------------------------------
+# Navigate and wait until content settles
+# -----------------------------------
+def _wait_kwargs(start, selector, text, quiet_ms, timeout_ms):
+    """
+    wait_for_function arguments for what is left of the budget, or None
+    once goto has used it up (Playwright reads timeout=0 as no timeout)
+    """
+    remaining_ms = timeout_ms - (time.time() - start) * 1000
+    if remaining_ms < 1:
+        return None
+    return {
+        "arg": {"quietMs": quiet_ms, "selector": selector, "text": text},
+        "polling": READY_POLL_MS,
+        "timeout": remaining_ms,
+    }
+
+
+def _record(url, start, ready, timeout_ms, error=None):
+    if not ready:
+        # Ceiling hit: render whatever is there rather than failing the quiz
+        logger.warning(f"Page not ready after {timeout_ms} ms, continuing anyway: {error}")
+    elapsed_ms = round((time.time() - start) * 1000, 1)
+    READINESS_RECORDER.record(url, elapsed_ms, ready)
+    logger.info(f"Page ready={ready} in {elapsed_ms} ms: {url}")
+    return {"ready": ready, "elapsed_ms": elapsed_ms}
+
+
+def goto_when_ready(page, url, selector=READY_SELECTOR, text=READY_TEXT,
+                    quiet_ms=READY_QUIET_MS, timeout_ms=READY_TIMEOUT_MS):
+    """
+    Navigate to url and return once the DOM has been quiet for quiet_ms and
+    the optional selector/text predicate holds, or when timeout_ms runs out.
+
+    Returns a dict with the elapsed time and whether the page became ready.
+    """
+    page.add_init_script(MUTATION_OBSERVER_SCRIPT)
+
+    start = time.time()
+    page.goto(url, wait_until="domcontentloaded")
+
+    kwargs = _wait_kwargs(start, selector, text, quiet_ms, timeout_ms)
+    if kwargs is None:
+        return _record(url, start, False, timeout_ms, "navigation used the whole budget")
+    try:
+        page.wait_for_function(READY_PREDICATE, **kwargs)
+    except Exception as e:
+        return _record(url, start, False, timeout_ms, e)
+    return _record(url, start, True, timeout_ms)
+
+
+async def goto_when_ready_async(page, url, selector=READY_SELECTOR, text=READY_TEXT,
+                                quiet_ms=READY_QUIET_MS, timeout_ms=READY_TIMEOUT_MS):
+    """
+    Async Playwright version of goto_when_ready
+    """
+    await page.add_init_script(MUTATION_OBSERVER_SCRIPT)
+
+    start = time.time()
+    await page.goto(url, wait_until="domcontentloaded")
+
+    kwargs = _wait_kwargs(start, selector, text, quiet_ms, timeout_ms)
+    if kwargs is None:
+        return _record(url, start, False, timeout_ms, "navigation used the whole budget")
+    try:
+        await page.wait_for_function(READY_PREDICATE, **kwargs)
+    except Exception as e:
+        return _record(url, start, False, timeout_ms, e)
+    return _record(url, start, True, timeout_ms)
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Prompt budget configuration
+# -----------------------------------
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 6000))  # whole prompt, estimated
+PROMPT_FIELD_CHARS = int(os.environ.get("PROMPT_FIELD_CHARS", 400))  # longest string kept in a file preview
+PROMPT_PREVIEW_ITEMS = int(os.environ.get("PROMPT_PREVIEW_ITEMS", 3))  # rows / pages / keys per preview
+
+# Fields that cost tokens without helping the model answer
+DROPPED_FIELDS = {"base64_preview", "content_hash"}
+# What a file is reduced to when the full preview does not fit
+SUMMARY_FIELDS = ("url", "content_type", "size", "type", "pages", "columns", "shape", "error", "parse_error")
+
+_WORD = re.compile(r"[a-z0-9_]{3,}")
+_BOILERPLATE = re.compile(r"^[^\d,;:\t=]+$")
+
+
+def estimate_tokens(text):
+    """Rough token count; ~4 characters per token for English and JSON"""
+    return (len(text) + 3) // 4
+
+
+def is_boilerplate(line):
+    """
+    Page chrome such as headers, footers and nav text: prose with no digits
+    and no field separators, so a data row or "key: value" line never
+    qualifies
+    """
+    return bool(_BOILERPLATE.match(line)) and len(_WORD.findall(line.lower())) >= 2
+
+
+def compact_instructions(instructions, max_tokens):
+    """
+    Instructions that are over max_tokens with repeated boilerplate lines
+    and runs of blank lines dropped, keeping the first occurrence. Text
+    within budget is returned unchanged.
+    """
+    if estimate_tokens(instructions) <= max_tokens:
+        return instructions
+    seen = set()
+    lines = []
+    for line in instructions.splitlines():
+        key = line.strip()
+        if not key:
+            if lines and lines[-1]:
+                lines.append("")
+            continue
+        if key in seen and is_boilerplate(key):
+            continue
+        seen.add(key)
+        lines.append(line.rstrip())
+    return "\n".join(lines).strip()
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Keep the head and tail of text within max_tokens"""
+    max_chars = max(0, max_tokens * 4)
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n...[{len(text) - max_chars} characters omitted]...\n{text[-half:]}"
+
+
+def _shrink(value):
+    """Cut long strings and long lists inside a preview"""
+    if isinstance(value, str):
+        return value if len(value) <= PROMPT_FIELD_CHARS else value[:PROMPT_FIELD_CHARS] + "..."
+    if isinstance(value, list):
+        return [_shrink(v) for v in value[:PROMPT_PREVIEW_ITEMS]]
+    if isinstance(value, tuple):
+        return list(value)
+    if isinstance(value, dict):
+        return {k: _shrink(v) for k, v in value.items() if k not in DROPPED_FIELDS}
+    return value
+
+
+def compact_file(file_info, summary_only=False):
+    if summary_only:
+        return {k: file_info[k] for k in SUMMARY_FIELDS if k in file_info}
+    return _shrink(file_info)
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def relevance(file_info, instruction_words):
+    """Score a file by how many of its name and column words the instructions mention"""
+    if "error" in file_info or "parse_error" in file_info:
+        return -1
+    words = set(_WORD.findall(urlparse(file_info.get("url", "")).path.lower()))
+    for column in file_info.get("columns") or []:
+        words.update(_WORD.findall(str(column).lower()))
+    return len(words & instruction_words)
+
+
+def render_files(files, instructions, max_tokens):
+    """
+    Compact JSON for the data files, most relevant first. Files that do not
+    fit in max_tokens are cut down to a summary, then left out.
+    """
+    if not files:
+        return "[]"
+
+    instruction_words = set(_WORD.findall(instructions.lower()))
+    ranked = sorted(files, key=lambda f: relevance(f, instruction_words), reverse=True)
+
+    rendered = []
+    used = 2
+    omitted = 0
+    for file_info in ranked:
+        for summary_only in (False, True):
+            text = _dumps(compact_file(file_info, summary_only))
+            if used + estimate_tokens(text) + 1 <= max_tokens:
+                rendered.append(text)
+                used += estimate_tokens(text) + 1
+                break
+        else:
+            omitted += 1
+
+    if omitted:
+        rendered.append(_dumps({"omitted_files": omitted, "reason": "prompt token budget"}))
+    return "[" + ",".join(rendered) + "]"
+
+
+def log_prompt_size(prompt, sections):
+    """Log the estimated tokens of a prompt and its main sections"""
+    breakdown = ", ".join(f"{name}={estimate_tokens(text)}" for name, text in sections.items())
+    logger.info(f"Prompt size: ~{estimate_tokens(prompt)} tokens ({breakdown}), budget {PROMPT_TOKEN_BUDGET}")
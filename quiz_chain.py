@@ -0,0 +1,84 @@
+import os
+import time
+import logging
+from model_router import MODEL_ROUTING_ENABLED, ROUTER_STATS
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Chain scheduling configuration
+# -----------------------------------
+QUIZ_TIME_LIMIT = float(os.environ.get("QUIZ_TIME_LIMIT", 170))  # seconds, safety margin under 3 min
+CHAIN_MAX_HOPS = int(os.environ.get("CHAIN_MAX_HOPS", 20))
+CHAIN_MAX_RETRIES = int(os.environ.get("CHAIN_MAX_RETRIES", 2))
+CHAIN_DEFAULT_RETRY_COST = float(os.environ.get("CHAIN_DEFAULT_RETRY_COST", 30))
+
+
+class ChainScheduler:
+    """
+    Decide whether to retry a wrong answer, move on to the next quiz URL or
+    stop, based on the budget left since the first request arrived
+    """
+
+    def __init__(self, start_time, time_limit=QUIZ_TIME_LIMIT, max_hops=CHAIN_MAX_HOPS,
+                 max_retries=CHAIN_MAX_RETRIES, default_retry_cost=CHAIN_DEFAULT_RETRY_COST):
+        self.start_time = start_time
+        self.time_limit = time_limit
+        self.max_hops = max_hops
+        self.max_retries = max_retries
+        self.default_retry_cost = default_retry_cost
+        self._attempt_costs = []
+
+    def deadline(self):
+        """Wall-clock time by which the whole chain must be finished"""
+        return self.start_time + self.time_limit
+
+    def remaining(self):
+        return self.time_limit - (time.time() - self.start_time)
+
+    def record_attempt(self, seconds):
+        """Remember how long one solve + submit round took"""
+        self._attempt_costs.append(seconds)
+
+    def estimated_retry_cost(self):
+        if not self._attempt_costs:
+            return self.default_retry_cost
+        # Weight recent attempts more, they reflect current load best
+        estimate = self._attempt_costs[0]
+        for cost in self._attempt_costs[1:]:
+            estimate = 0.5 * estimate + 0.5 * cost
+        return estimate
+
+    def can_start_hop(self, hops_done):
+        if hops_done >= self.max_hops:
+            logger.warning(f"Stopping chain after {hops_done} hops")
+            return False
+        if self.remaining() <= 0:
+            logger.warning("Stopping chain, time budget exhausted")
+            return False
+        return True
+
+    def next_action(self, submission_result, attempts, route=None):
+        """
+        Return ("retry", None), ("next", url) or ("done", None) for a hop
+        after its latest submission. A retry moves the hop's model route
+        (its question type) up a tier, which is counted here, once per retry.
+        """
+        if not isinstance(submission_result, dict):
+            return "done", None
+
+        next_url = submission_result.get("url")
+        if submission_result.get("correct") is True:
+            return ("next", next_url) if next_url else ("done", None)
+
+        retry_cost = self.estimated_retry_cost()
+        if attempts <= self.max_retries and self.remaining() > retry_cost:
+            logger.info(f"Wrong answer, retrying ({self.remaining():.1f}s left, retry ~{retry_cost:.1f}s)")
+            if route and MODEL_ROUTING_ENABLED:
+                ROUTER_STATS.record_escalation(route, "grader_rejection")
+            return "retry", None
+
+        if next_url:
+            logger.info(f"Skipping ahead to {next_url} ({self.remaining():.1f}s left)")
+            return "next", next_url
+        return "done", None
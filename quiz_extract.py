@@ -0,0 +1,203 @@
+import re
+import json
+import logging
+from urllib.parse import urljoin
+from file_pipeline import FILE_URL_PATTERN, file_extension
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Extraction patterns, compiled once
+# -----------------------------------
+URL_PATTERN = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+')
+SUBMIT_PHRASE = re.compile(r"post\s+your\s+answer\s+to", re.IGNORECASE)
+RELATIVE_PATH = re.compile(r"^/[^\s<>\"']*$")
+
+FILE_TYPES = {"csv", "json", "pdf", "txt", "xlsx", "xls"}
+LINK_ATTRIBUTES = ("href", "src", "data-href", "data-src", "action")
+SKIPPED_TAGS = {"style", "template"}
+JSON_SCRIPT_TYPES = {"application/json", "application/ld+json"}
+
+# First matching group wins, in this order
+QUESTION_TYPES = (
+    ("calculation", ("sum", "total", "add", "calculate", "average", "count")),
+    ("file_processing", ("download", "file", "extract", "parse")),
+    ("information_extraction", ("scrape", "extract", "find", "what", "where")),
+    ("visualization", ("visualize", "chart", "graph", "plot")),
+)
+
+
+def classify_question(text):
+    lowered = text.lower()
+    for question_type, words in QUESTION_TYPES:
+        if any(word in lowered for word in words):
+            return question_type
+    return "unknown"
+
+
+def inline_json_objects(text):
+    """
+    Every balanced top-level {...} in text that parses as a JSON object,
+    found in one scan (nested braces and braces inside strings included)
+    """
+    objects = []
+    start = None
+    depth = 0
+    in_string = escape = False
+    for pos, c in enumerate(text):
+        if start is None:
+            if c == "{":
+                start, depth = pos, 1
+        elif in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    obj = json.loads(text[start:pos + 1])
+                    if isinstance(obj, dict):
+                        objects.append(obj)
+                except ValueError:
+                    pass
+                start = None
+    return objects
+
+
+# -----------------------------------
+# Single pass over the rendered HTML
+# -----------------------------------
+def _walk(html_content, base_url):
+    """
+    One lxml walk in document order collecting visible text lines, link
+    attributes and JSON script bodies
+    """
+    import lxml.html
+    from lxml import etree
+
+    root = lxml.html.document_fromstring(html_content)
+    lines, links, json_blocks = [], [], []
+
+    def add_text(text):
+        if text:
+            text = text.strip()
+            if text:
+                lines.append(text)
+
+    skipping = 0
+    for event, el in etree.iterwalk(root, events=("start", "end")):
+        tag = el.tag if isinstance(el.tag, str) else None  # comments and PIs have no string tag
+        if event == "start":
+            if tag is None:
+                continue
+            if tag == "base" and el.get("href") and base_url:
+                base_url = urljoin(base_url, el.get("href"))
+            for name in LINK_ATTRIBUTES:
+                value = el.get(name)
+                if value and not value.startswith(("#", "javascript:", "mailto:", "data:")):
+                    links.append(urljoin(base_url, value.strip()) if base_url else value.strip())
+            if tag == "script":
+                if (el.get("type") or "").lower() in JSON_SCRIPT_TYPES and el.text:
+                    json_blocks.append(el.text)
+                skipping += 1
+            elif tag in SKIPPED_TAGS:
+                skipping += 1
+            elif not skipping:
+                add_text(el.text)
+        else:
+            if tag == "script" or tag in SKIPPED_TAGS:
+                skipping -= 1
+            if not skipping and el is not root:
+                add_text(el.tail)
+    return lines, links, json_blocks, base_url
+
+
+def _scan_lines(lines, base_url=None):
+    """
+    Text-level fields from the instruction lines: every URL, the data file
+    URLs, and the submit URL named after "post your answer to"
+    """
+    urls, file_urls = [], []
+    phrase_url = None
+    pending_phrase = False
+    for line in lines:
+        line_urls = URL_PATTERN.findall(line)
+        if line_urls:
+            urls.extend(line_urls)
+            file_urls.extend(FILE_URL_PATTERN.findall(line))
+        if phrase_url:
+            continue
+        if pending_phrase:
+            # The URL is usually on the line right after the phrase
+            pending_phrase = False
+            if line_urls:
+                phrase_url = line_urls[0]
+            elif base_url and RELATIVE_PATH.match(line):
+                phrase_url = urljoin(base_url, line)
+            continue
+        match = SUBMIT_PHRASE.search(line)
+        if match:
+            after = URL_PATTERN.findall(line[match.end():])
+            if after:
+                phrase_url = after[0]
+            else:
+                pending_phrase = True
+    return urls, file_urls, phrase_url
+
+
+def _build(instructions, urls, file_urls, links, phrase_url, inline_json):
+    """Assemble the shared extraction result"""
+    file_urls = list(dict.fromkeys(file_urls + [
+        u.split("#")[0] for u in links
+        if u.startswith(("http://", "https://")) and file_extension(u) in FILE_TYPES
+    ]))
+
+    submit_url = phrase_url
+    if not submit_url:
+        submit_url = next((obj["url"] for obj in inline_json if isinstance(obj.get("url"), str)), None)
+    if not submit_url:
+        submit_url = next((u for u in urls + links if "submit" in u.lower()), None)
+
+    return {
+        "cleaned_instructions": instructions,
+        "submit_url": submit_url,
+        "file_urls": file_urls,
+        "inline_json": inline_json,
+        "question_type": classify_question(instructions),
+    }
+
+
+def extract_quiz(html_content, base_url=None):
+    """
+    Extract instructions, submit URL, file links (visible text and
+    href/src attributes), inline JSON and question type from rendered HTML
+    in a single parse
+    """
+    lines, links, json_blocks, base_url = _walk(html_content, base_url)
+    instructions = "\n".join(lines)
+    urls, file_urls, phrase_url = _scan_lines(lines, base_url)
+
+    inline_json = []
+    for block in json_blocks:
+        try:
+            obj = json.loads(block)
+            if isinstance(obj, dict):
+                inline_json.append(obj)
+        except ValueError:
+            continue
+    inline_json.extend(inline_json_objects(instructions))
+    return _build(instructions, urls, file_urls, links, phrase_url, inline_json)
+
+
+def extract_from_text(instructions):
+    """The same fields for plain instruction text, when there is no HTML"""
+    urls, file_urls, phrase_url = _scan_lines([line.strip() for line in instructions.splitlines()])
+    return _build(instructions, urls, file_urls, [], phrase_url, inline_json_objects(instructions))
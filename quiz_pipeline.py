@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import logging
+import http_client
+from contextlib import contextmanager
+from quiz_solver import solve_quiz_with_ai
+from quiz_extract import extract_quiz
+from browser_pool import BROWSER_POOL
+from page_readiness import goto_when_ready
+from request_blocking import BLOCKING_PROFILE
+from static_fetch import fetch_static, FETCH_TIER_STATS
+from quiz_chain import ChainScheduler, QUIZ_TIME_LIMIT
+from retry_policy import SUBMIT_RETRY
+from tracing import span
+from strategy_race import cancel_race
+from model_router import record_route_outcome
+
+logger = logging.getLogger(__name__)
+
+# The quiz pipeline shared by app.py and async_app.py. Importing it starts
+# nothing: pools, job queues and web apps belong to the entry points.
+
+# -----------------------------------
+# Load environment variables
+# -----------------------------------
+STUDENT_EMAIL = os.environ.get("STUDENT_EMAIL")
+STUDENT_SECRET = os.environ.get("STUDENT_SECRET")
+
+
+def check_credentials():
+    """Log an error when the credentials every submission needs are missing"""
+    if not STUDENT_EMAIL or not STUDENT_SECRET:
+        logger.error("Missing required environment variables: STUDENT_EMAIL and STUDENT_SECRET must be set")
+
+# -----------------------------------
+# Fetch and render quiz page with JavaScript
+# -----------------------------------
+def fetch_quiz_page(url):
+    """
+    Fetch quiz HTML, trying a plain GET first and rendering with a warm
+    pooled browser only when the page needs JavaScript
+    """
+    logger.info(f"Fetching quiz page: {url}")
+    with span("fetch.static"):
+        content = fetch_static(url)
+    if content:
+        return content
+
+    start = time.time()
+    with span("fetch.browser") as current:
+        try:
+            content = BROWSER_POOL.run(lambda context: render_page(context, url))
+            FETCH_TIER_STATS.record("browser", True, time.time() - start)
+            logger.info(f"Successfully fetched quiz page: {url}")
+            return content
+        except Exception as e:
+            current.fail(e)
+            FETCH_TIER_STATS.record("browser", False, time.time() - start)
+            logger.error(f"Error fetching quiz page {url}: {e}")
+            return None
+
+def render_page(context, url):
+    """
+    Render a single quiz page inside a checked-out browser context
+    """
+    page = context.new_page()
+    # Abort images, fonts, styles and trackers the parser never looks at
+    blocking_stats = BLOCKING_PROFILE.install(page, url)
+    try:
+        # Set longer timeout for slow pages
+        page.set_default_timeout(30000)
+
+        # Navigate to the quiz URL and wait until the content stops changing
+        goto_when_ready(page, url)
+
+        # Get the fully rendered HTML
+        return page.content()
+    finally:
+        page.close()
+        BLOCKING_PROFILE.record(blocking_stats)
+
+# -----------------------------------
+# Extract quiz instructions and submit URL
+# -----------------------------------
+def parse_quiz_content(html_content, base_url=None):
+    """
+    Parse the rendered HTML to extract quiz instructions and submit URL.
+
+    One lxml pass also collects file links and inline JSON; the result is
+    kept under "extracted" so the solver does not scan the text again.
+    """
+    try:
+        extracted = extract_quiz(html_content, base_url)
+        logger.info(f"Extracted submit URL: {extracted['submit_url']}, files: {extracted['file_urls']}")
+
+        return {
+            "instructions": extracted["cleaned_instructions"],
+            "submit_url": extracted["submit_url"],
+            "html_content": html_content,
+            "extracted": extracted
+        }
+    except Exception as e:
+        logger.error(f"Error parsing quiz content: {e}")
+        return None
+
+# -----------------------------------
+# Submit answer to the target URL
+# -----------------------------------
+def submit_answer(submit_url, answer_data, deadline=None):
+    """
+    Submit the final answer to the specified endpoint
+    """
+    try:
+        logger.info(f"Submitting answer to: {submit_url}")
+        logger.info(f"Submission data: {answer_data}")
+
+        response = SUBMIT_RETRY.call(
+            submit_url,
+            lambda timeout: http_client.post(submit_url, json=answer_data, timeout=timeout),
+            deadline
+        )
+        return read_submission_response(response)
+
+    except Exception as e:
+        logger.error(f"Error submitting answer to {submit_url}: {e}")
+        return {"error": str(e)}
+
+def read_submission_response(response):
+    """
+    The grader's reply as a dict, for the sync and async submit alike
+    """
+    logger.info(f"Submission response status: {response.status_code}")
+
+    # Try to parse JSON response
+    try:
+        result = response.json()
+        logger.info(f"Submission response: {result}")
+        return result
+    except json.JSONDecodeError:
+        # If not JSON, return text response
+        logger.warning(f"Non-JSON response: {response.text[:200]}")
+        return {
+            "status": response.status_code,
+            "text": response.text[:500] if response.text else "Empty response"
+        }
+
+# -----------------------------------
+# Request validation and answer payload
+# -----------------------------------
+def validate_quiz_request(body):
+    """
+    Return (error message, status code) for a bad /quiz body, or None
+    """
+    # Validate required fields
+    required_fields = ["email", "secret", "url"]
+    for field in required_fields:
+        if field not in body:
+            return f"Missing field: {field}", 400
+
+    # Authenticate
+    if body["email"] != STUDENT_EMAIL or body["secret"] != STUDENT_SECRET:
+        return "Invalid email or secret", 403
+
+    return None
+
+def build_answer_payload(quiz_url, ai_solution):
+    """
+    Build the submission body from the AI solution
+    """
+    answer_payload = {
+        "email": STUDENT_EMAIL,
+        "secret": STUDENT_SECRET,
+        "url": quiz_url,
+        "answer": ai_solution.get("answer")
+    }
+
+    # Add any additional fields from AI solution
+    if "additional_fields" in ai_solution:
+        answer_payload.update(ai_solution["additional_fields"])
+
+    return answer_payload
+
+# -----------------------------------
+# Quiz chain: hops and attempts
+# -----------------------------------
+@contextmanager
+def timed_stage(stages, name):
+    """
+    Record the wall-clock seconds spent in a pipeline stage, and trace it
+    as a span
+    """
+    stage_start = time.time()
+    try:
+        with span(name):
+            yield
+    finally:
+        if stages is not None:
+            stages[name] = round(time.time() - stage_start, 3)
+
+def run_quiz(quiz_url, start_time, stages=None):
+    """
+    Solve a quiz and keep following the next URLs the grader hands back
+    until the chain ends or the time budget runs out
+    """
+    scheduler = ChainScheduler(start_time)
+    hops = []
+    current_url = quiz_url
+    result, status = {"error": "Time budget exhausted before first hop"}, 500
+
+    while current_url and scheduler.can_start_hop(len(hops)):
+        hop_stages = {}
+        with span("hop", url=current_url):
+            result, status, next_url = run_hop(current_url, start_time, scheduler, hop_stages)
+        record_hop(hops, stages, current_url, status, hop_stages)
+        if status != 200:
+            break
+        current_url = next_url
+
+    return finish_chain(result, status, hops, start_time)
+
+def run_hop(quiz_url, start_time, scheduler, stages):
+    """
+    Fetch, solve and submit one quiz, retrying wrong answers while the
+    scheduler allows; returns (response body, status code, next URL)
+    """
+    logger.info(f"Processing quiz URL: {quiz_url}")
+
+    try:
+        # Step 1: Fetch and render the quiz page
+        with timed_stage(stages, "fetch"):
+            html_content = fetch_quiz_page(quiz_url)
+        if not html_content:
+            return {"error": "Failed to fetch quiz page"}, 500, None
+
+        # Step 2: Parse quiz content
+        with timed_stage(stages, "parse"):
+            quiz_data = parse_quiz_content(html_content, quiz_url)
+        if not quiz_data:
+            return {"error": "Failed to parse quiz content"}, 500, None
+
+        logger.info(f"Parsed instructions preview: {quiz_data['instructions'][:500]}...")
+        logger.info(f"Submit URL found: {quiz_data['submit_url']}")
+
+        start_attempts(quiz_data, scheduler, stages)
+        while True:
+            attempt_stages = {}
+            stages["attempts"].append(attempt_stages)
+            attempt_start = time.time()
+
+            # Step 3: Use AI to solve the quiz
+            with timed_stage(attempt_stages, "solve"):
+                ai_solution = solve_quiz_with_ai(quiz_data)
+            if not ai_solution:
+                return {"error": "AI failed to solve quiz"}, 500, None
+
+            logger.info(f"AI solution: {ai_solution}")
+
+            # Step 4: Prepare answer payload
+            answer_payload = build_answer_payload(quiz_url, ai_solution)
+
+            # Step 5: Submit answer
+            submit_url = ai_solution.get("submit_url") or quiz_data.get("submit_url")
+            if not submit_url:
+                return {"error": "No submit URL found"}, 500, None
+
+            with timed_stage(attempt_stages, "submit"):
+                submission_result = submit_answer(submit_url, answer_payload, quiz_data["deadline"])
+
+            # Step 6: Retry, move on or stop
+            action, next_url = finish_attempt(quiz_data, scheduler, stages, ai_solution, submission_result, attempt_start)
+            if action != "retry":
+                break
+
+        result, status = finish_hop(start_time, quiz_data, submit_url, ai_solution, submission_result)
+        return result, status, next_url
+
+    except Exception as e:
+        logger.error(f"Unexpected error in quiz endpoint: {e}")
+        return {"error": "Internal server error", "details": str(e)}, 500, None
+
+def start_attempts(quiz_data, scheduler, stages):
+    """
+    Prepare a parsed quiz for its first attempt
+    """
+    quiz_data["previous_attempts"] = []
+    quiz_data["deadline"] = scheduler.deadline()
+    stages["attempts"] = []
+
+def finish_attempt(quiz_data, scheduler, stages, ai_solution, submission_result, attempt_start):
+    """
+    Record a submitted attempt and return the scheduler's (action, next URL).
+    A rejected answer that will be retried is fed back to the solver.
+    """
+    record_route_outcome(ai_solution, submission_result)
+    scheduler.record_attempt(time.time() - attempt_start)
+    question_type = (quiz_data.get("extracted") or {}).get("question_type")
+    action, next_url = scheduler.next_action(submission_result, len(stages["attempts"]), question_type)
+    if action == "retry":
+        quiz_data["previous_attempts"].append({
+            "answer": ai_solution.get("answer"),
+            "reason": submission_result.get("reason")
+        })
+    return action, next_url
+
+def finish_hop(start_time, quiz_data, submit_url, ai_solution, submission_result):
+    """
+    Cancel what is left of the hop's strategy race and build its response
+    """
+    # Strategies still running can no longer help this quiz
+    cancel_race(quiz_data)
+    return build_quiz_result(start_time, quiz_data, submit_url, ai_solution, submission_result)
+
+def record_hop(hops, stages, url, status, hop_stages):
+    """
+    Add a finished hop to the chain summary and the job's stage timings
+    """
+    hops.append({"url": url, "status_code": status, "stages": hop_stages})
+    if stages is not None:
+        stages[f"hop_{len(hops)}"] = hop_stages
+
+def finish_chain(result, status, hops, start_time):
+    """
+    Attach the per-hop summary to the last hop's response
+    """
+    result = dict(result)
+    result["hops"] = hops
+    result["time_elapsed"] = round(time.time() - start_time, 2)
+    return result, status
+
+def build_quiz_result(start_time, quiz_data, submit_url, ai_solution, submission_result):
+    """
+    Final /quiz response body and status, enforcing the time limit
+    """
+    # Check if we're within time limit
+    elapsed_time = time.time() - start_time
+    if elapsed_time > QUIZ_TIME_LIMIT:
+        return {"error": "Approaching timeout limit", "elapsed_time": elapsed_time}, 500
+
+    return {
+        "status": "completed",
+        "submission_result": submission_result,
+        "time_elapsed": round(elapsed_time, 2),
+        "quiz_instructions_preview": quiz_data["instructions"][:200] + "..." if len(quiz_data["instructions"]) > 200 else quiz_data["instructions"],
+        "submit_url_used": submit_url,
+        "answer_submitted": ai_solution.get("answer")
+    }, 200
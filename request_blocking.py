@@ -0,0 +1,143 @@
+import os
+import re
+import threading
+import logging
+from collections import deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Interception profile configuration
+# -----------------------------------
+def _env_list(name, default):
+    value = os.environ.get(name, default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+BLOCKED_RESOURCE_TYPES = _env_list("BLOCKED_RESOURCE_TYPES", "image,font,stylesheet,media")
+BLOCKED_URL_PATTERNS = _env_list(
+    "BLOCKED_URL_PATTERNS",
+    r"google-analytics\.com,googletagmanager\.com,doubleclick\.net,facebook\.net,"
+    r"hotjar\.com,segment\.(io|com),plausible\.io,clarity\.ms,sentry\.io"
+)
+# Anything matching these is always let through, even if otherwise blocked
+ALLOWED_URL_PATTERNS = _env_list("ALLOWED_URL_PATTERNS", "")
+BLOCK_THIRD_PARTY_SCRIPTS = os.environ.get("BLOCK_THIRD_PARTY_SCRIPTS", "0") == "1"
+REQUEST_BLOCKING_ENABLED = os.environ.get("REQUEST_BLOCKING_ENABLED", "1") == "1"
+
+# Aborted requests never report a size, so savings are estimated per type
+ESTIMATED_BYTES = {
+    "image": 60000,
+    "font": 40000,
+    "stylesheet": 20000,
+    "media": 500000,
+    "script": 30000,
+}
+DEFAULT_ESTIMATED_BYTES = 10000
+
+
+# -----------------------------------
+# Blocking profile
+# -----------------------------------
+class BlockingProfile:
+    """
+    Decide which page sub-requests to abort and keep per-page counters
+    """
+
+    def __init__(self, resource_types=None, url_patterns=None, allowed_patterns=None,
+                 block_third_party_scripts=BLOCK_THIRD_PARTY_SCRIPTS, enabled=REQUEST_BLOCKING_ENABLED):
+        self.resource_types = set(BLOCKED_RESOURCE_TYPES if resource_types is None else resource_types)
+        self.url_patterns = [re.compile(p, re.IGNORECASE) for p in (BLOCKED_URL_PATTERNS if url_patterns is None else url_patterns)]
+        self.allowed_patterns = [re.compile(p, re.IGNORECASE) for p in (ALLOWED_URL_PATTERNS if allowed_patterns is None else allowed_patterns)]
+        self.block_third_party_scripts = block_third_party_scripts
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=50)
+        self._totals = {"pages": 0, "requests": 0, "blocked": 0, "bytes_saved_estimate": 0}
+
+    def should_block(self, url, resource_type, page_host):
+        """Return the reason a request should be aborted, or None"""
+        if any(p.search(url) for p in self.allowed_patterns):
+            return None
+        if resource_type in self.resource_types:
+            return f"type:{resource_type}"
+        if any(p.search(url) for p in self.url_patterns):
+            return "pattern"
+        if (self.block_third_party_scripts and resource_type == "script"
+                and urlparse(url).hostname != page_host):
+            return "third_party_script"
+        return None
+
+    def _new_page_stats(self, page_url):
+        return {"url": page_url, "requests": 0, "blocked": 0, "bytes_saved_estimate": 0, "blocked_by_type": {}}
+
+    def _check(self, stats, req, page_host):
+        """Count a request against the page stats and return whether to abort it"""
+        stats["requests"] += 1
+        reason = self.should_block(req.url, req.resource_type, page_host)
+        if reason:
+            stats["blocked"] += 1
+            stats["bytes_saved_estimate"] += ESTIMATED_BYTES.get(req.resource_type, DEFAULT_ESTIMATED_BYTES)
+            by_type = stats["blocked_by_type"]
+            by_type[req.resource_type] = by_type.get(req.resource_type, 0) + 1
+        return bool(reason)
+
+    def install(self, page, page_url):
+        """
+        Route all requests of page through the profile.
+
+        Returns the stats dict for this page; it fills in as the page loads.
+        """
+        stats = self._new_page_stats(page_url)
+        if not self.enabled:
+            return stats
+
+        page_host = urlparse(page_url).hostname
+
+        def handle(route):
+            if self._check(stats, route.request, page_host):
+                route.abort()
+            else:
+                route.continue_()
+
+        page.route("**/*", handle)
+        return stats
+
+    async def install_async(self, page, page_url):
+        """Async Playwright version of install"""
+        stats = self._new_page_stats(page_url)
+        if not self.enabled:
+            return stats
+
+        page_host = urlparse(page_url).hostname
+
+        async def handle(route):
+            if self._check(stats, route.request, page_host):
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await page.route("**/*", handle)
+        return stats
+
+    def record(self, stats):
+        """Fold a finished page's stats into the totals"""
+        logger.info(f"Request blocking for {stats['url']}: blocked {stats['blocked']}/{stats['requests']} "
+                    f"requests, ~{stats['bytes_saved_estimate']} bytes saved")
+        with self._lock:
+            self._recent.append(stats)
+            self._totals["pages"] += 1
+            self._totals["requests"] += stats["requests"]
+            self._totals["blocked"] += stats["blocked"]
+            self._totals["bytes_saved_estimate"] += stats["bytes_saved_estimate"]
+
+    def summary(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                **self._totals,
+                "recent": list(self._recent)[-5:],
+            }
+
+
+BLOCKING_PROFILE = BlockingProfile()
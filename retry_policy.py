@@ -0,0 +1,337 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from tracing import span, count_retry_event
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Retry configuration
+# -----------------------------------
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", 0.5))  # seconds before the first retry
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", 10))  # cap per backoff, Retry-After included
+# Global retry budget: a token bucket shared by every request in the process
+RETRY_BUDGET_TOKENS = float(os.environ.get("RETRY_BUDGET_TOKENS", 20))
+RETRY_BUDGET_REFILL = float(os.environ.get("RETRY_BUDGET_REFILL", 1))  # tokens per second
+# Per-host circuit breaker
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5))  # consecutive failures to open
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 30))  # seconds before a probe
+
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while a host's breaker is open"""
+
+
+def retry_after_seconds(headers):
+    """Delay asked for by a Retry-After header (seconds or HTTP date), or None"""
+    value = (headers or {}).get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------------
+# Shared retry budget
+# -----------------------------------
+class RetryBudget:
+    """
+    Token bucket limiting how many retries the whole process may send, so a
+    struggling upstream is not hit by every request retrying at once
+    """
+
+    def __init__(self, capacity=RETRY_BUDGET_TOKENS, refill_rate=RETRY_BUDGET_REFILL):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def available(self):
+        with self._lock:
+            elapsed = time.time() - self._updated
+            return round(min(self.capacity, self._tokens + elapsed * self.refill_rate), 2)
+
+
+RETRY_BUDGET = RetryBudget()
+
+
+# -----------------------------------
+# Per-host circuit breaker
+# -----------------------------------
+class CircuitBreaker:
+    """
+    Closed until failure_threshold consecutive failures, then open for
+    cooldown seconds; after that a single probe decides whether it closes
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        return self._hosts.setdefault(host, {"failures": 0, "opened_at": None, "probing": False, "opens": 0})
+
+    def allow(self, host):
+        with self._lock:
+            h = self._host(host)
+            if h["opened_at"] is None:
+                return True
+            if time.time() - h["opened_at"] < self.cooldown or h["probing"]:
+                return False
+            h["probing"] = True
+            return True
+
+    def release(self, host):
+        """Give up a half-open probe that ended without an outcome"""
+        with self._lock:
+            self._host(host)["probing"] = False
+
+    def is_open(self, host):
+        with self._lock:
+            h = self._host(host)
+            return h["opened_at"] is not None and time.time() - h["opened_at"] < self.cooldown
+
+    def record(self, host, success):
+        with self._lock:
+            h = self._host(host)
+            h["probing"] = False
+            if success:
+                h["failures"] = 0
+                h["opened_at"] = None
+                return
+            h["failures"] += 1
+            if h["opened_at"] is not None or h["failures"] >= self.failure_threshold:
+                if h["opened_at"] is None:
+                    h["opens"] += 1
+                    logger.warning(f"Circuit opened for {host} after {h['failures']} failures")
+                h["opened_at"] = time.time()
+
+    def summary(self):
+        now = time.time()
+        with self._lock:
+            result = {}
+            for host, h in self._hosts.items():
+                if h["opened_at"] is None:
+                    state = "closed"
+                elif now - h["opened_at"] < self.cooldown:
+                    state = "open"
+                else:
+                    state = "half_open"
+                result[host] = {"state": state, "failures": h["failures"], "opens": h["opens"]}
+            return result
+
+
+CIRCUIT_BREAKER = CircuitBreaker()
+
+
+# -----------------------------------
+# Retry policy
+# -----------------------------------
+class RetryPolicy:
+    """
+    Run one request with exponential backoff and full jitter.
+
+    attempt(timeout) sends the request and returns a response; exceptions
+    and RETRY_STATUSES are retried, honouring Retry-After. A retry is only
+    started if the shared budget has a token and the backoff plus the
+    typical attempt duration fits before the deadline. The last response is
+    returned (or the last exception raised) once retrying stops.
+    """
+
+    def __init__(self, name, max_attempts, timeout, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 budget=RETRY_BUDGET, breaker=CIRCUIT_BREAKER):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker
+        self._lock = threading.Lock()
+        self._avg_attempt = None
+        self._stats = {"calls": 0, "retries": 0, "successes": 0, "failures": 0,
+                       "stopped_by_deadline": 0, "stopped_by_budget": 0, "short_circuited": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+        count_retry_event(self.name, key)
+
+    def _record_duration(self, seconds):
+        with self._lock:
+            self._avg_attempt = seconds if self._avg_attempt is None else 0.7 * self._avg_attempt + 0.3 * seconds
+
+    def _attempt_timeout(self, deadline):
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError(f"{self.name}: deadline passed before the request started")
+        return min(self.timeout, remaining)
+
+    def _outcome(self, host, result, error, elapsed):
+        """Return (retryable, Retry-After delay) and feed the breaker"""
+        self._record_duration(elapsed)
+        if error is not None:
+            self.breaker.record(host, False)
+            return True, None
+        status = getattr(result, "status_code", None)
+        if status in RETRY_STATUSES:
+            self.breaker.record(host, False)
+            return True, retry_after_seconds(getattr(result, "headers", None))
+        self.breaker.record(host, True)
+        return False, None
+
+    def _next_delay(self, host, attempt, max_attempts, retry_after, deadline):
+        """Backoff before the next attempt, or None if retrying should stop"""
+        if attempt >= max_attempts or self.breaker.is_open(host):
+            return None
+        if retry_after is not None:
+            delay = retry_after
+            if delay > self.max_delay:
+                logger.warning(f"{self.name}: Retry-After {delay:.1f}s exceeds {self.max_delay}s, giving up")
+                return None
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+        if deadline is not None:
+            expected = self._avg_attempt or 0.0
+            if time.time() + delay + expected > deadline:
+                self._count("stopped_by_deadline")
+                logger.warning(f"{self.name}: no time left for another attempt before the deadline")
+                return None
+        if not self.budget.try_acquire():
+            self._count("stopped_by_budget")
+            logger.warning(f"{self.name}: retry budget exhausted")
+            return None
+        self._count("retries")
+        return delay
+
+    def _check_breaker(self, host):
+        if not self.breaker.allow(host):
+            self._count("short_circuited")
+            raise CircuitOpenError(f"{self.name}: circuit open for {host}")
+
+    def _finish(self, result, error, retryable):
+        self._count("failures" if retryable else "successes")
+        if error is not None:
+            raise error
+        return result
+
+    def call(self, url, attempt, deadline=None, max_attempts=None):
+        """Run attempt(timeout) against url with retries (blocking)"""
+        host = urlparse(url).hostname or "unknown"
+        max_attempts = max_attempts or self.max_attempts
+        self._count("calls")
+        for n in range(1, max_attempts + 1):
+            timeout = self._attempt_timeout(deadline)
+            if n == 1:
+                self._check_breaker(host)
+            result, error = None, None
+            start = time.time()
+            try:
+                with span(f"{self.name}.attempt", attempt=n) as current:
+                    try:
+                        result = attempt(timeout)
+                    except Exception as e:
+                        error = e
+                        current.fail(e)
+                    if getattr(result, "status_code", None) in RETRY_STATUSES:
+                        current.fail(f"HTTP {result.status_code}")
+                retryable, retry_after = self._outcome(host, result, error, time.time() - start)
+            finally:
+                # A cancelled probe (CancelledError is a BaseException) never
+                # reaches _outcome and would keep the breaker half-open for good
+                if result is None and error is None:
+                    self.breaker.release(host)
+            if not retryable:
+                return self._finish(result, None, False)
+
+            delay = self._next_delay(host, n, max_attempts, retry_after, deadline)
+            if delay is None:
+                return self._finish(result, error, True)
+            logger.info(f"{self.name}: attempt {n} failed ({error or result.status_code}), retrying in {delay:.2f}s")
+            if hasattr(result, "close"):
+                result.close()
+            time.sleep(delay)
+
+    async def acall(self, url, attempt, deadline=None, max_attempts=None):
+        """Async version of call; attempt(timeout) is awaited"""
+        host = urlparse(url).hostname or "unknown"
+        max_attempts = max_attempts or self.max_attempts
+        self._count("calls")
+        for n in range(1, max_attempts + 1):
+            timeout = self._attempt_timeout(deadline)
+            if n == 1:
+                self._check_breaker(host)
+            result, error = None, None
+            start = time.time()
+            try:
+                with span(f"{self.name}.attempt", attempt=n) as current:
+                    try:
+                        result = await attempt(timeout)
+                    except Exception as e:
+                        error = e
+                        current.fail(e)
+                    if getattr(result, "status_code", None) in RETRY_STATUSES:
+                        current.fail(f"HTTP {result.status_code}")
+                retryable, retry_after = self._outcome(host, result, error, time.time() - start)
+            finally:
+                # A cancelled probe (CancelledError is a BaseException) never
+                # reaches _outcome and would keep the breaker half-open for good
+                if result is None and error is None:
+                    self.breaker.release(host)
+            if not retryable:
+                return self._finish(result, None, False)
+
+            delay = self._next_delay(host, n, max_attempts, retry_after, deadline)
+            if delay is None:
+                return self._finish(result, error, True)
+            logger.info(f"{self.name}: attempt {n} failed ({error or result.status_code}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "avg_attempt_ms": round(self._avg_attempt * 1000, 1) if self._avg_attempt is not None else None,
+            }
+
+
+AI_RETRY = RetryPolicy("ai", int(os.environ.get("RETRY_AI_ATTEMPTS", 3)), timeout=60)
+DOWNLOAD_RETRY = RetryPolicy("download", int(os.environ.get("RETRY_DOWNLOAD_ATTEMPTS", 3)), timeout=30)
+SUBMIT_RETRY = RetryPolicy("submit", int(os.environ.get("RETRY_SUBMIT_ATTEMPTS", 3)), timeout=30)
+
+
+def retry_summary():
+    return {
+        "policies": {p.name: p.stats() for p in (AI_RETRY, DOWNLOAD_RETRY, SUBMIT_RETRY)},
+        "budget_tokens": RETRY_BUDGET.available(),
+        "circuits": CIRCUIT_BREAKER.summary(),
+    }
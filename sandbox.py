@@ -0,0 +1,361 @@
+import os
+import io
+import sys
+import json
+import time
+import base64
+import queue
+import atexit
+import select
+import signal
+import shutil
+import tempfile
+import threading
+import subprocess
+import contextlib
+import traceback
+import logging
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Sandbox configuration
+# -----------------------------------
+SANDBOX_ENABLED = os.environ.get("SANDBOX_ENABLED", "1") == "1"
+SANDBOX_POOL_SIZE = int(os.environ.get("SANDBOX_POOL_SIZE", 2))  # warm interpreters
+SANDBOX_CPU_SECONDS = int(os.environ.get("SANDBOX_CPU_SECONDS", 20))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", 2048))  # address space per run
+SANDBOX_WALL_SECONDS = float(os.environ.get("SANDBOX_WALL_SECONDS", 30))
+SANDBOX_MAX_OUTPUT = int(os.environ.get("SANDBOX_MAX_OUTPUT", 10000))  # characters of stdout kept
+SANDBOX_CHECKOUT_TIMEOUT = float(os.environ.get("SANDBOX_CHECKOUT_TIMEOUT", 30))
+SANDBOX_UID = int(os.environ.get("SANDBOX_UID", 65534))  # "nobody"; runs drop to it when started as root, -1 to keep root
+
+# Audit events refused inside a run: no network, no new processes, no
+# signals, no native code loading
+BLOCKED_AUDIT_EVENTS = {
+    "socket.__new__", "socket.connect", "socket.bind", "socket.getaddrinfo", "socket.gethostbyname",
+    "subprocess.Popen", "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.fork", "os.forkpty",
+    "os.kill", "os.killpg", "pty.spawn", "ctypes.dlopen", "ctypes.dlsym", "ctypes.cdata",
+}
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+
+# -----------------------------------
+# Worker side: warm interpreter that forks one child per run
+# -----------------------------------
+def _json_value(value):
+    """Best-effort conversion of a sandbox result into JSON"""
+    if isinstance(value, (bytes, bytearray)):
+        # File answers are submitted as data URIs; encode only here
+        return "data:application/octet-stream;base64," + base64.b64encode(value).decode("ascii")
+    try:
+        import numpy as np
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+    except ImportError:
+        pass
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _drop_privileges(workdir):
+    """Run as SANDBOX_UID when started as root, so other processes' /proc entries are off limits"""
+    if os.geteuid() != 0 or SANDBOX_UID < 0:
+        return
+    os.chown(workdir, SANDBOX_UID, SANDBOX_UID)
+    os.setgroups([])
+    os.setgid(SANDBOX_UID)
+    os.setuid(SANDBOX_UID)
+
+
+def _unshare_network():
+    """
+    Move the child into new user and network namespaces, leaving it only
+    a loopback interface that is down. Best effort: where namespaces are
+    not allowed (e.g. Docker's default seccomp profile) the audit hook is
+    the only network guard.
+    """
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.unshare(CLONE_NEWUSER | CLONE_NEWNET) == 0
+    except Exception:
+        return False
+
+
+def _audit_guard(event, args):
+    """Audit hook for the child: refuse blocked events and any access to /proc"""
+    if event in BLOCKED_AUDIT_EVENTS:
+        raise PermissionError(f"{event} is not allowed in the sandbox")
+    if event in ("open", "os.listdir", "os.scandir") and args and isinstance(args[0], (str, bytes)):
+        path = os.path.realpath(os.fsdecode(args[0]))
+        if path == "/proc" or path.startswith("/proc/"):
+            raise PermissionError(f"Access to {path} is not allowed in the sandbox")
+
+
+def _execute(job, preloaded):
+    """Run one job in the forked child; returns the reply dict"""
+    import resource
+    memory = job["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_CPU, (job["cpu_seconds"], job["cpu_seconds"]))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (64 * 1024 * 1024, 64 * 1024 * 1024))
+    os.chdir(job["workdir"])
+    _drop_privileges(job["workdir"])
+    _unshare_network()
+    # Hooks cannot be removed once added, and only this child has it
+    sys.addaudithook(_audit_guard)
+
+    def mmap_file(path):
+        """Read-only memory map of a staged file"""
+        import mmap
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    namespace = {"__name__": "__sandbox__", "files": job["files"], "mmap_file": mmap_file, "result": None}
+    namespace.update(preloaded)
+    stdout = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(compile(job["code"], "<solver>", "exec"), namespace)
+        return {"ok": True, "result": _json_value(namespace.get("result")),
+                "stdout": stdout.getvalue()[-job["max_output"]:]}
+    except BaseException:
+        return {"ok": False, "error": traceback.format_exc(limit=5)[-2000:],
+                "stdout": stdout.getvalue()[-job["max_output"]:]}
+
+
+def _run_forked(job, preloaded):
+    """Fork a child for job and wait for it under the wall-clock limit"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            reply = json.dumps(_execute(job, preloaded), default=str)
+        except BaseException as e:
+            reply = json.dumps({"ok": False, "error": f"Sandbox failure: {e}"})
+        with os.fdopen(write_fd, "w") as out:
+            out.write(reply)
+        os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    end_time = time.time() + job["wall_seconds"]
+    timed_out = False
+    with os.fdopen(read_fd, "rb") as pipe:
+        while True:
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                timed_out = True
+                break
+            ready, _, _ = select.select([pipe], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(pipe.fileno(), 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+    _, status = os.waitpid(pid, 0)
+    if timed_out:
+        return {"ok": False, "error": f"Wall-clock limit of {job['wall_seconds']}s exceeded"}
+    try:
+        return json.loads(b"".join(chunks).decode("utf-8"))
+    except ValueError:
+        if os.WIFSIGNALED(status):
+            name = signal.Signals(os.WTERMSIG(status)).name
+            return {"ok": False, "error": f"Killed by {name} (CPU or memory limit)"}
+        return {"ok": False, "error": "Sandbox produced no result"}
+
+
+def worker_main():
+    """
+    Warm interpreter: import pandas/NumPy once, then fork a fresh child for
+    every job read from stdin so runs never see each other's state
+    """
+    preloaded = {}
+    for name, alias in (("pandas", "pd"), ("numpy", "np"), ("re", "re"), ("json", "json"), ("math", "math")):
+        try:
+            preloaded[alias] = __import__(name)
+        except ImportError:
+            pass
+
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    protocol_out.write("ready\n")
+    protocol_out.flush()
+    for line in sys.stdin:
+        reply = _run_forked(json.loads(line), preloaded)
+        protocol_out.write(json.dumps(reply, default=str) + "\n")
+        protocol_out.flush()
+
+
+# -----------------------------------
+# Parent side: pool of warm workers
+# -----------------------------------
+class SandboxWorker:
+    """One warm interpreter subprocess, used by one run at a time"""
+
+    def __init__(self):
+        env = {
+            "PATH": os.environ.get("PATH", ""),
+            "PYTHONPATH": os.path.dirname(os.path.abspath(__file__)),
+            "OMP_NUM_THREADS": "1",
+            "OPENBLAS_NUM_THREADS": "1",
+            "MKL_NUM_THREADS": "1",
+        }
+        self.runs = 0
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            env=env, text=True, bufsize=1,
+        )
+        self._ready = False
+
+    def _readline(self, timeout):
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise TimeoutError("Sandbox worker did not answer in time")
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("Sandbox worker exited")
+        return line
+
+    def run(self, job, timeout):
+        if not self._ready:
+            # First use waits for the pandas import to finish
+            if self._readline(60).strip() != "ready":
+                raise RuntimeError("Sandbox worker failed to start")
+            self._ready = True
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        self.runs += 1
+        return json.loads(self._readline(timeout))
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class SandboxPool:
+    """
+    Fixed-size pool of warm Python interpreters for running generated code.
+
+    Each run is forked from an interpreter that already imported pandas and
+    NumPy, with CPU-time, address-space and wall-clock limits. Workers are
+    started lazily so gunicorn workers create their own after forking, and a
+    worker that misbehaves is replaced.
+
+    This limits resources and hardens the run; it is not isolation. Workers
+    get a scrubbed environment (no tokens or secrets). Each run drops to
+    SANDBOX_UID when started as root, enters empty network namespaces where
+    the kernel allows it, and has an audit hook that refuses sockets,
+    subprocesses, signals, ctypes and /proc. The code can still read any
+    file its uid can read, and an audit hook can be bypassed by a
+    determined attacker. Untrusted code needs a container or VM boundary.
+    """
+
+    def __init__(self, size=SANDBOX_POOL_SIZE, checkout_timeout=SANDBOX_CHECKOUT_TIMEOUT):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._workers = []
+        self._stats = {"runs": 0, "ok": 0, "errors": 0, "timeouts": 0, "replaced": 0, "total_ms": 0.0}
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                worker = SandboxWorker()
+                self._workers.append(worker)
+                self._idle.put(worker)
+            self._started = True
+            atexit.register(self.shutdown)
+        logger.info(f"Started sandbox pool with {self.size} interpreters")
+
+    def _replace(self, worker):
+        worker.stop()
+        fresh = SandboxWorker()
+        with self._lock:
+            self._workers = [fresh if w is worker else w for w in self._workers]
+            self._stats["replaced"] += 1
+        return fresh
+
+    def run(self, code, files=None, wall_seconds=SANDBOX_WALL_SECONDS, cpu_seconds=SANDBOX_CPU_SECONDS,
+            memory_mb=SANDBOX_MEMORY_MB):
+        """
+        Execute code with files ({url: local path}) in scope and return
+        {"ok", "result", "stdout", "error"}; the code sets `result`
+        """
+        self.start()
+        try:
+            worker = self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No sandbox interpreter available after {self.checkout_timeout}s")
+
+        workdir = tempfile.mkdtemp(prefix="sandbox-")
+        job = {
+            "code": code, "files": files or {}, "workdir": workdir, "cpu_seconds": cpu_seconds,
+            "memory_mb": memory_mb, "wall_seconds": wall_seconds, "max_output": SANDBOX_MAX_OUTPUT,
+        }
+        start = time.time()
+        try:
+            reply = worker.run(job, timeout=wall_seconds + 5)
+        except Exception as e:
+            logger.error(f"Sandbox worker failed, replacing it: {e}")
+            worker = self._replace(worker)
+            reply = {"ok": False, "error": str(e)}
+        finally:
+            self._idle.put(worker if worker.alive() else self._replace(worker))
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["ok" if reply.get("ok") else "errors"] += 1
+            if "limit" in (reply.get("error") or ""):
+                self._stats["timeouts"] += 1
+            self._stats["total_ms"] += (time.time() - start) * 1000
+        return reply
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+            self._idle = queue.Queue()
+            self._started = False
+
+    def stats(self):
+        with self._lock:
+            runs = self._stats["runs"]
+            return {
+                "size": self.size,
+                "started": self._started,
+                **{k: v for k, v in self._stats.items() if k != "total_ms"},
+                "avg_ms": round(self._stats["total_ms"] / runs, 1) if runs else 0.0,
+            }
+
+
+SANDBOX_POOL = SandboxPool()
+
+
+if __name__ == "__main__":
+    worker_main()
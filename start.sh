@@ -2,5 +2,10 @@
 # Install Playwright browsers
 playwright install --with-deps
 
+if [ "$ASYNC_MODE" = "1" ]; then
+    # Async mode: one ASGI process runs many quizzes concurrently
+    exec hypercorn async_app:app --bind 0.0.0.0:$PORT --workers 1
+fi
+
 # Start Flask with Gunicorn
 exec gunicorn app:app --bind 0.0.0.0:$PORT --workers 1
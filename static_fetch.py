@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import base64
+import threading
+import binascii
+import logging
+import http_client
+from page_readiness import READY_SELECTOR, READY_TEXT
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Static fetch configuration
+# -----------------------------------
+STATIC_FETCH_ENABLED = os.environ.get("STATIC_FETCH_ENABLED", "1") == "1"
+STATIC_FETCH_TIMEOUT = float(os.environ.get("STATIC_FETCH_TIMEOUT", 10))
+STATIC_MIN_TEXT = int(os.environ.get("STATIC_MIN_TEXT", 40))
+
+ATOB_PATTERN = re.compile(r"""atob\(\s*(["'`])([A-Za-z0-9+/=\s\\]+?)\1\s*\)""")
+SCRIPT_PATTERN = re.compile(r"<script\b([^>]*)>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+# Inline script code that fills the page in at runtime
+DYNAMIC_SCRIPT_PATTERN = re.compile(r"innerHTML|innerText|textContent|document\.write|appendChild|insertAdjacent|fetch\(|XMLHttpRequest")
+
+
+# -----------------------------------
+# Per-tier hit rates and latencies
+# -----------------------------------
+class FetchTierStats:
+    """Count attempts, hits and latency for each fetch tier"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+
+    def record(self, tier, hit, elapsed):
+        with self._lock:
+            t = self._tiers.setdefault(tier, {"attempts": 0, "hits": 0, "total_ms": 0.0})
+            t["attempts"] += 1
+            t["hits"] += 1 if hit else 0
+            t["total_ms"] += elapsed * 1000
+
+    def summary(self):
+        with self._lock:
+            return {
+                tier: {
+                    "attempts": t["attempts"],
+                    "hits": t["hits"],
+                    "hit_rate": round(t["hits"] / t["attempts"], 3) if t["attempts"] else 0.0,
+                    "avg_ms": round(t["total_ms"] / t["attempts"], 1) if t["attempts"] else 0.0,
+                }
+                for tier, t in self._tiers.items()
+            }
+
+
+FETCH_TIER_STATS = FetchTierStats()
+
+
+# -----------------------------------
+# Inline base64 payloads
+# -----------------------------------
+def decode_atob_payloads(html_content):
+    """
+    Decode every atob("...") literal found in the page's scripts
+    """
+    decoded = []
+    for match in ATOB_PATTERN.finditer(html_content):
+        blob = re.sub(r"\s|\\n", "", match.group(2))
+        try:
+            decoded.append(base64.b64decode(blob, validate=True).decode("utf-8"))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            continue
+    return decoded
+
+
+def inline_decoded_payloads(html_content, payloads):
+    """Splice decoded payloads into the body so the parser sees them as text"""
+    block = "".join(f'<div data-static-decoded="atob">{p}</div>' for p in payloads)
+    idx = html_content.lower().rfind("</body>")
+    if idx < 0:
+        return html_content + block
+    return html_content[:idx] + block + html_content[idx:]
+
+
+# -----------------------------------
+# Decide whether the raw HTML is good enough
+# -----------------------------------
+def needs_browser(html_content, decoded_payloads):
+    """
+    True if the page has scripts we could not replay in Python
+    """
+    for attrs, body in SCRIPT_PATTERN.findall(html_content):
+        if "src=" in attrs.lower():
+            return True
+        if DYNAMIC_SCRIPT_PATTERN.search(body) and not ATOB_PATTERN.search(body):
+            return True
+    return False
+
+
+def instructions_present(html_content, selector=READY_SELECTOR, text=READY_TEXT):
+    """
+    Check the static HTML for the same predicate the browser readiness uses
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+    if selector and not soup.select_one(selector):
+        return False
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    visible = soup.get_text(separator="\n", strip=True)
+    if text and text.lower() not in visible.lower():
+        return False
+    return len(visible) >= STATIC_MIN_TEXT
+
+
+def evaluate_static_html(raw):
+    """
+    Decide whether raw page HTML already holds the instructions.
+
+    Returns (html or None, tier name).
+    """
+    payloads = decode_atob_payloads(raw)
+    candidate = inline_decoded_payloads(raw, payloads) if payloads else raw
+    tier = "static_decoded" if payloads else "static"
+    # An explicit predicate is trusted; otherwise require no unexplained JS
+    explicit = bool(READY_SELECTOR or READY_TEXT)
+    if instructions_present(candidate) and (explicit or not needs_browser(raw, payloads)):
+        return candidate, tier
+    return None, tier
+
+
+def fetch_static(url):
+    """
+    Try to get quiz HTML without a browser.
+
+    Returns HTML (with any atob payloads decoded inline) or None when the
+    page needs a real JavaScript render.
+    """
+    if not STATIC_FETCH_ENABLED:
+        return None
+
+    start = time.time()
+    html_content = None
+    tier = "static"
+    try:
+        response = http_client.get(url, timeout=STATIC_FETCH_TIMEOUT)
+        content_type = response.headers.get("content-type", "")
+        if response.status_code == 200 and "html" in content_type.lower():
+            html_content, tier = evaluate_static_html(response.text)
+    except Exception as e:
+        logger.warning(f"Static fetch failed for {url}: {e}")
+
+    FETCH_TIER_STATS.record(tier, html_content is not None, time.time() - start)
+    if html_content:
+        logger.info(f"Served quiz page from {tier} tier: {url}")
+    return html_content
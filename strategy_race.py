@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from tracing import span, bind
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Strategy race configuration
+# -----------------------------------
+RACE_ENABLED = os.environ.get("RACE_ENABLED", "1") == "1"
+RACE_WORKERS = int(os.environ.get("RACE_WORKERS", 10))  # strategy threads shared by all quizzes (sync mode)
+RACE_MIN_CONFIDENCE = float(os.environ.get("RACE_MIN_CONFIDENCE", 0.8))  # a candidate this sure wins at once
+RACE_ALT_FRAMING = os.environ.get("RACE_ALT_FRAMING", "0") == "1"  # second LLM prompt with generic framing (doubles model cost)
+RACE_AGREEMENT_BONUS = 0.05  # added when two strategies reach the same answer; ranks fallbacks
+
+# How far each strategy's answer is trusted
+STRATEGY_CONFIDENCE = {
+    "local_compute": 0.95,
+    "code_exec": 0.85,
+    "llm": 0.7,
+    "llm_alt": 0.65,
+    # simple_solver's pattern answers are unchecked guesses: a last resort only
+    "rule_based": 0.4,
+}
+# Confidence for a model reply that was not valid JSON
+UNPARSED_CONFIDENCE = 0.3
+# Framings of the same model prompt; the first to answer does not wait for the other
+MODEL_STRATEGIES = {"llm", "llm_alt"}
+
+_race_pool = ThreadPoolExecutor(max_workers=RACE_WORKERS, thread_name_prefix="strategy")
+
+# Set inside each strategy to the stop event of the race it belongs to
+_race_stop = contextvars.ContextVar("race_stop", default=None)
+
+
+class RaceCancelled(Exception):
+    """The strategy's race already has a winner"""
+
+
+def check_cancelled():
+    """
+    Raise RaceCancelled when called from a strategy whose race is decided.
+    Model calls check this first, so losing strategies stop before their
+    next LLM request; outside a race it does nothing.
+    """
+    stop = _race_stop.get()
+    if stop is not None and stop.is_set():
+        raise RaceCancelled()
+
+
+def answer_key(answer):
+    """Comparable form of an answer, so 42, 42.0 and "42" count as one"""
+    try:
+        return f"n:{round(float(answer), 6)}"
+    except (TypeError, ValueError):
+        pass
+    if isinstance(answer, str):
+        return f"s:{answer.strip().lower()}"
+    return "j:" + json.dumps(answer, sort_keys=True, default=str)
+
+
+def plan_strategies(question_type, previous_attempts, has_tabular, has_usable, code_exec_types):
+    """
+    Strategy names worth running for this question. Deterministic
+    strategies would only repeat a rejected answer, so retries run just the
+    model prompts (with the grader's feedback).
+    """
+    names = []
+    if not previous_attempts:
+        names.append("rule_based")
+        if question_type == "calculation" and has_tabular:
+            names.append("local_compute")
+        if question_type in code_exec_types and has_usable:
+            names.append("code_exec")
+    names.append("llm")
+    if RACE_ALT_FRAMING and question_type not in ("information_extraction", "unknown"):
+        names.append("llm_alt")
+    return names
+
+
+# -----------------------------------
+# Candidate answers for one quiz
+# -----------------------------------
+class CandidatePool:
+    """
+    Every answer the strategies produced for one quiz, including the ones
+    that finished after the winner was submitted. A rejected answer is
+    replaced by the best remaining candidate without solving again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._candidates = []
+        self._rejected = set()
+        self._handles = []
+        self._files = None
+        self._files_lock = threading.Lock()
+        self._afiles_lock = None
+        self.cancelled = threading.Event()
+
+    def files(self, loader):
+        """Processed files for the quiz, loaded once and shared by every strategy"""
+        with self._files_lock:
+            if self._files is None:
+                self._files = loader()
+            return self._files
+
+    async def afiles(self, loader):
+        """Async version of files; loader is a coroutine function"""
+        if self._afiles_lock is None:
+            self._afiles_lock = asyncio.Lock()
+        async with self._afiles_lock:
+            if self._files is None:
+                self._files = await loader()
+            return self._files
+
+    def add(self, name, solution):
+        """Record a strategy's solution; returns it with its confidence set"""
+        if not solution or solution.get("answer") is None:
+            return None
+        confidence = STRATEGY_CONFIDENCE.get(name, 0.5)
+        if str(solution.get("reasoning") or "").startswith("Fallback"):
+            confidence = UNPARSED_CONFIDENCE
+        solution = dict(solution, strategy=name, confidence=confidence)
+        key = answer_key(solution["answer"])
+        with self._lock:
+            for other in self._candidates:
+                if answer_key(other["answer"]) == key:
+                    # Independent strategies agreeing is better evidence than either alone
+                    bonus = min(1.0, max(other["confidence"], confidence) + RACE_AGREEMENT_BONUS)
+                    other["confidence"] = solution["confidence"] = round(bonus, 3)
+            self._candidates.append(solution)
+        return solution
+
+    def track(self, handle):
+        """Remember a future or task so cancel() can stop it"""
+        with self._lock:
+            self._handles.append(handle)
+
+    def reject(self, answer):
+        with self._lock:
+            self._rejected.add(answer_key(answer))
+
+    def best(self, min_confidence=0.0):
+        """Most confident candidate not yet rejected, or None"""
+        with self._lock:
+            remaining = [c for c in self._candidates
+                         if answer_key(c["answer"]) not in self._rejected and c["confidence"] >= min_confidence]
+        return max(remaining, key=lambda c: c["confidence"], default=None)
+
+    def next_fallback(self, previous_attempts):
+        """Best candidate whose answer the grader has not rejected yet"""
+        for attempt in previous_attempts or []:
+            self.reject(attempt.get("answer"))
+        return self.best()
+
+    def cancel(self):
+        """Stop strategies that are still running once the quiz is settled"""
+        self.cancelled.set()
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for handle in handles:
+            handle.cancel()
+
+    def summary(self):
+        with self._lock:
+            return [{"strategy": c["strategy"], "answer": c["answer"], "confidence": c["confidence"]}
+                    for c in self._candidates]
+
+
+def candidate_pool(quiz_data):
+    """The quiz's CandidatePool, created on first use"""
+    pool = quiz_data.get("candidates")
+    if pool is None:
+        pool = quiz_data["candidates"] = CandidatePool()
+    return pool
+
+
+def cancel_race(quiz_data):
+    pool = quiz_data.get("candidates") if quiz_data else None
+    if pool is not None:
+        pool.cancel()
+
+
+# -----------------------------------
+# Race statistics
+# -----------------------------------
+class RaceStats:
+    """Which strategies win, and how often fallbacks are resubmitted"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wins = {}
+        self._finished = {}
+        self._stats = {"races": 0, "no_answer": 0, "fallbacks_used": 0}
+
+    def record_finish(self, name, produced):
+        with self._lock:
+            f = self._finished.setdefault(name, {"runs": 0, "answers": 0, "cancelled": 0})
+            f["runs"] += 1
+            f["answers"] += 1 if produced else 0
+
+    def record_cancelled(self, name):
+        with self._lock:
+            f = self._finished.setdefault(name, {"runs": 0, "answers": 0, "cancelled": 0})
+            f["cancelled"] += 1
+
+    def record_race(self, winner):
+        with self._lock:
+            self._stats["races"] += 1
+            if winner:
+                self._wins[winner] = self._wins.get(winner, 0) + 1
+            else:
+                self._stats["no_answer"] += 1
+
+    def record_fallback(self):
+        with self._lock:
+            self._stats["fallbacks_used"] += 1
+
+    def summary(self):
+        with self._lock:
+            return {**self._stats, "wins": dict(self._wins), "strategies": {k: dict(v) for k, v in self._finished.items()}}
+
+
+RACE_STATS = RaceStats()
+
+
+def take_fallback(quiz_data, pool):
+    """
+    After a rejected answer, another strategy's candidate to resubmit at
+    once, or None when a new race is needed
+    """
+    previous_attempts = quiz_data.get("previous_attempts")
+    fallback = pool.next_fallback(previous_attempts) if previous_attempts else None
+    if fallback:
+        RACE_STATS.record_fallback()
+        logger.info(f"Resubmitting {fallback['strategy']} candidate {fallback['answer']!r}")
+    return fallback
+
+
+# -----------------------------------
+# Racing
+# -----------------------------------
+def _strength(candidate):
+    """A candidate's confidence, with every parsed model answer ranked as the main prompt"""
+    confidence = candidate["confidence"]
+    if candidate["strategy"] in MODEL_STRATEGIES and confidence > UNPARSED_CONFIDENCE:
+        return max(confidence, STRATEGY_CONFIDENCE["llm"])
+    return confidence
+
+
+def _settled(pool, pending_names, min_confidence):
+    """
+    The race's winner so far: the best candidate if it reaches
+    min_confidence, or if no strategy still running could do better.
+    Otherwise None, and the race keeps waiting.
+    """
+    best = pool.best()
+    if best is None:
+        return None
+    if best["confidence"] >= min_confidence:
+        return best
+    ceiling = max((STRATEGY_CONFIDENCE.get(name, 0.5) for name in pending_names
+                   if name not in MODEL_STRATEGIES or best["strategy"] not in MODEL_STRATEGIES), default=0.0)
+    return best if _strength(best) >= ceiling else None
+
+
+def _finish(pool, name, solution):
+    solution = pool.add(name, solution)
+    RACE_STATS.record_finish(name, solution is not None)
+    if solution:
+        logger.info(f"Strategy {name} answered {solution['answer']!r} (confidence {solution['confidence']})")
+    return solution
+
+
+def race(strategies, pool, deadline=None, min_confidence=RACE_MIN_CONFIDENCE):
+    """
+    Run strategies ({name: fn()}) concurrently and return the first
+    solution with at least min_confidence, or the best one as soon as no
+    stronger strategy is still running. The losers are cancelled:
+    queued ones never start and running ones stop at their next model call.
+    """
+    stop = threading.Event()
+
+    def run(name, fn):
+        if pool.cancelled.is_set() or stop.is_set():
+            return None
+        _race_stop.set(stop)
+        with span(f"strategy.{name}") as current:
+            try:
+                solution = fn()
+            except RaceCancelled:
+                current.set(cancelled=True)
+                RACE_STATS.record_cancelled(name)
+                return None
+            except Exception as e:
+                current.fail(e)
+                logger.warning(f"Strategy {name} failed: {e}")
+                solution = None
+            return _finish(pool, name, solution)
+
+    names = {}
+    for name, fn in strategies.items():
+        future = _race_pool.submit(bind(run), name, fn)
+        pool.track(future)
+        names[future] = name
+    pending = set(names)
+
+    winner = None
+    while pending and winner is None:
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            logger.warning("Strategy race reached the deadline")
+            break
+        winner = _settled(pool, [names[f] for f in pending], min_confidence)
+
+    stop.set()
+    for future in pending:
+        if future.cancel():
+            RACE_STATS.record_cancelled(names[future])
+    winner = winner or pool.best()
+    RACE_STATS.record_race(winner and winner["strategy"])
+    return winner
+
+
+async def arace(strategies, pool, deadline=None, min_confidence=RACE_MIN_CONFIDENCE):
+    """
+    Async version of race; strategies map names to coroutine functions and
+    the losers are cancelled outright
+    """
+    async def run(name, fn):
+        with span(f"strategy.{name}") as current:
+            try:
+                solution = await fn()
+            except asyncio.CancelledError:
+                current.set(cancelled=True)
+                RACE_STATS.record_cancelled(name)
+                raise
+            except Exception as e:
+                current.fail(e)
+                logger.warning(f"Strategy {name} failed: {e}")
+                solution = None
+            return _finish(pool, name, solution)
+
+    names = {}
+    for name, fn in strategies.items():
+        task = asyncio.create_task(run(name, fn))
+        pool.track(task)
+        names[task] = name
+    pending = set(names)
+
+    winner = None
+    while pending and winner is None:
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            logger.warning("Strategy race reached the deadline")
+            break
+        winner = _settled(pool, [names[t] for t in pending], min_confidence)
+
+    for task in pending:
+        task.cancel()
+    winner = winner or pool.best()
+    RACE_STATS.record_race(winner and winner["strategy"])
+    return winner
@@ -3,6 +3,7 @@ import requests
 import os
 import sys
 import json
+import time
 from datetime import datetime
 
 # Endpoint to test
@@ -65,8 +66,19 @@ def test_demo_quiz(url):
         )
 
         assert r.status_code == 200
+        job_id = r.json()["job_id"]
+
+        # The quiz runs in the background; poll until the job finishes
+        deadline = time.time() + 180
+        while time.time() < deadline:
+            job = requests.get(f"{ROOT_URL}jobs/{job_id}", timeout=5).json()
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(2)
+
+        assert job["status"] == "completed"
         print("✅ Demo quiz test passed")
-        print(json.dumps(r.json(), indent=2))
+        print(json.dumps(job, indent=2))
         return True
     except Exception as e:
         print(f"❌ Demo quiz failed: {e}")
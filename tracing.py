@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------
+# Tracing configuration
+# -----------------------------------
+TRACE_JOBS = os.environ.get("TRACE_JOBS", "1") == "1"  # attach the span list to each job's stages
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", 500))  # spans kept per job trace
+TRACE_BUCKETS = tuple(
+    float(b) for b in os.environ.get(
+        "TRACE_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,180"
+    ).split(",")
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# -----------------------------------
+# Metrics registry (Prometheus text format)
+# -----------------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe counters and latency histograms keyed by name and labels,
+    rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self, buckets=TRACE_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    h["counts"][i] += 1
+                    break
+            h["sum"] += seconds
+            h["count"] += 1
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, dict(v, counts=list(v["counts"]))) for k, v in self._histograms.items())
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+
+        for (name, labels), h in histograms:
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, h["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {h['count']}")
+            lines.append(f"{name}_sum{_label_text(labels)} {round(h['sum'], 6)}")
+            lines.append(f"{name}_count{_label_text(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+METRICS.describe("quiz_span_seconds", "Duration of pipeline stages and sub-calls")
+METRICS.describe("quiz_span_failures_total", "Spans that raised or were marked failed")
+METRICS.describe("quiz_retry_events_total", "Retry policy events by policy")
+METRICS.describe("quiz_cache_lookups_total", "Cache lookups by cache and result")
+METRICS.describe("quiz_llm_tokens_total", "LLM tokens reported by the API")
+METRICS.describe("quiz_llm_bytes_total", "LLM request and response bytes")
+METRICS.describe("quiz_http_request_seconds", "Outbound HTTP request duration by host")
+METRICS.describe("quiz_http_errors_total", "Outbound HTTP requests that failed or returned 5xx")
+
+
+# -----------------------------------
+# Spans and per-job traces
+# -----------------------------------
+class Trace:
+    """Spans recorded for one job, shared by every thread and task it uses"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def new_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def add(self, span):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: (s["start_ms"], s["id"]))
+            return {"spans": spans, "dropped": self.dropped}
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.failed = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, reason):
+        """Mark the span failed without raising"""
+        self.failed = str(reason)[:300]
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a stage or sub-call. The duration feeds quiz_span_seconds, and
+    the span is added to the current job's trace if there is one.
+    """
+    current = Span(name, attrs)
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    span_id = trace.new_id() if trace else None
+    token = _current_span.set(span_id)
+    start = time.time()
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        elapsed = time.time() - start
+        METRICS.observe("quiz_span_seconds", elapsed, span=name)
+        if current.failed:
+            METRICS.inc("quiz_span_failures_total", span=name)
+        if trace:
+            record = {
+                "id": span_id,
+                "parent": parent,
+                "name": name,
+                "start_ms": round((start - trace.start) * 1000, 1),
+                "duration_ms": round(elapsed * 1000, 1),
+                "status": "error" if current.failed else "ok",
+            }
+            if current.failed:
+                record["error"] = current.failed
+            if current.attrs:
+                record["attrs"] = current.attrs
+            trace.add(record)
+
+
+@contextmanager
+def start_trace():
+    """Collect the spans of everything run inside the block into a new Trace"""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def bind(fn):
+    """
+    Wrap fn to run in a copy of the caller's context, so spans from pool
+    threads land in the caller's trace
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# -----------------------------------
+# Metric helpers for the instrumented modules
+# -----------------------------------
+def count_cache(cache, result):
+    METRICS.inc("quiz_cache_lookups_total", cache=cache, result=result)
+
+
+def count_retry_event(policy, event):
+    METRICS.inc("quiz_retry_events_total", policy=policy, event=event)
+
+
+def record_llm_usage(payload_bytes, response_bytes, usage=None):
+    """Byte counts for one LLM call, plus token counts when the API reports them"""
+    METRICS.inc("quiz_llm_bytes_total", payload_bytes, direction="sent")
+    METRICS.inc("quiz_llm_bytes_total", response_bytes, direction="received")
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage and isinstance(usage.get(kind), int):
+            METRICS.inc("quiz_llm_tokens_total", usage[kind], kind=kind.split("_")[0])
+
+
+def observe_http(record):
+    """HTTP_METRICS hook: latency histogram and error count per host"""
+    METRICS.observe("quiz_http_request_seconds", record["elapsed"], host=record["host"])
+    if record["error"] or (record["status"] or 0) >= 500:
+        METRICS.inc("quiz_http_errors_total", host=record["host"])